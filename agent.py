@@ -0,0 +1,951 @@
+"""Agent loop shared by mcp_client.py and mcp_client_with_mail.py.
+
+The tool list, system prompt and LLM client are set up once per MCP session and
+shared by every AgentRun, while each run keeps its own iteration state, so several
+queries can be solved concurrently in one process.
+"""
+
+import os
+import code
+import time
+import hashlib
+import logging
+import threading
+from dotenv import load_dotenv
+from mcp import ClientSession, StdioServerParameters, types
+from mcp.client.stdio import stdio_client
+from mcp.client.sse import sse_client
+from contextlib import aclosing, asynccontextmanager
+import asyncio
+import google.generativeai as genai
+from google.generativeai.types.generation_types import GenerateContentResponse
+from concurrent.futures import TimeoutError
+from rate_limiter import RateLimiter
+from conversation import ConversationHistory
+from llm_cache import LLMCache
+from agent_trace import LLMReplay, TraceRecorder, prompt_hash
+from llm_stream import LineSplitter, stream_chunks
+from llm_executor import LLMExecutor
+from metrics import MetricsRegistry
+from prompt_cache import PromptCache
+from tool_dispatch import build_dispatch_table
+from function_calling import (
+    build_gemini_tools,
+    extract_function_calls,
+    extract_text,
+)
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger("agent")
+
+# Access your API key and initialize Gemini client correctly
+api_key = os.getenv("GEMINI_API_KEY")
+model = genai.configure(api_key=api_key)
+model = genai.GenerativeModel(os.getenv("MODEL_NAME"))
+
+
+max_iterations = 10
+
+# Number of queries solved at the same time by run_queries
+agent_concurrency = int(os.getenv("AGENT_CONCURRENCY", 4))
+
+# Shared budget for the gemini API (15 requests per minute on the free tier by default)
+rate_limiter = RateLimiter.from_env()
+max_rate_limit_retries = 3
+
+# The blocking SDK calls run on their own bounded pool (LLM_MAX_IN_FLIGHT at a time)
+llm_executor = LLMExecutor.from_env()
+
+# Responses of previous runs with exactly the same prompt (LLM_CACHE_BYPASS=1 to disable)
+llm_cache = LLMCache.from_env()
+
+# Latency histograms of every run, written to AGENT_METRICS_PATH (.json or Prometheus text) after each run
+metrics = MetricsRegistry()
+metrics_path = os.getenv("AGENT_METRICS_PATH") or None
+
+# Rendered tools descriptions, keyed by a hash of the tool list (PROMPT_CACHE_DIR shares them across processes)
+prompt_cache = PromptCache.from_env()
+
+# Upload the system prompt once as gemini cached content instead of sending it with every prompt
+gemini_context_cache = os.getenv("GEMINI_CONTEXT_CACHE", "0").lower() in ("1", "true", "yes")
+gemini_context_cache_ttl = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 3600))
+
+# Connect to an already running server (e.g. `python mcp_server.py sse`) instead of spawning one per run
+mcp_server_url = os.getenv("MCP_SERVER_URL")
+
+# Pass the MCP tools to gemini as function declarations instead of the FUNCTION_CALL text protocol
+use_function_calling = os.getenv("USE_FUNCTION_CALLING", "0").lower() in ("1", "true", "yes")
+
+# Stream the responses of the text protocol and start each tool call as soon as its line is complete
+use_streaming = os.getenv("USE_STREAMING", "0").lower() in ("1", "true", "yes")
+
+# Write a JSONL trace of every run to this directory
+trace_dir = os.getenv("AGENT_TRACE_DIR") or None
+
+# Answer from the LLM responses recorded in these traces (comma separated) instead of calling gemini
+llm_replay = (
+    LLMReplay.from_files(os.getenv("AGENT_REPLAY").split(","))
+    if os.getenv("AGENT_REPLAY")
+    else None
+)
+
+# Step debugging: AGENT_DEBUG=1 opens a console before every batch of tool calls
+debug_hook = None
+
+
+def set_debug_hook(hook):
+    """Install (or remove with None) the hook awaited before the tool calls of every iteration
+
+    Args:
+        hook: Async callable taking the AgentRun and its list of (tool name, arguments)
+            calls, which it may edit in place. Without a hook the loop skips the call entirely.
+    """
+    global debug_hook
+    debug_hook = hook
+
+
+# One console at a time, even when several runs reach their tool calls together
+_console_lock = threading.Lock()
+
+
+def _console(run, function_calls):
+    with _console_lock:
+        code.interact(
+            banner=(
+                f"Run {run.run_id}, iteration {run.iteration + 1}: about to call "
+                f"{function_calls}\nEdit `function_calls` in place, Ctrl-D to continue"
+            ),
+            local={
+                "run": run,
+                "function_calls": function_calls,
+                "session": run.context.session,
+            },
+            exitmsg="",
+        )
+
+
+async def interactive_debug_hook(run, function_calls):
+    """Open a Python console on the run, in a thread so the MCP session stays alive"""
+    await asyncio.to_thread(_console, run, function_calls)
+
+
+if os.getenv("AGENT_DEBUG", "0").lower() in ("1", "true", "yes"):
+    set_debug_hook(interactive_debug_hook)
+
+
+def _add_timing(timings, key, started_at):
+    if timings is not None:
+        timings[key] = timings.get(key, 0.0) + time.perf_counter() - started_at
+
+
+def _model_key(llm):
+    """Model name for the response cache, telling apart the models bound to cached content"""
+    cached_content = getattr(llm, "cached_content", None)
+    return f"{llm.model_name}@{cached_content}" if cached_content else llm.model_name
+
+
+def read_protocol_lines(text):
+    """FUNCTION_CALL lines of a text response and its FINAL_ANSWER line (None without one)
+
+    Like the streaming mode, which stops the generation there, nothing after the first
+    FINAL_ANSWER line is read, and lines of any other text (e.g. a preamble) are skipped.
+    """
+    call_lines = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if line.startswith("FINAL_ANSWER:"):
+            return call_lines, line
+        if line.startswith("FUNCTION_CALL:"):
+            call_lines.append(line)
+    return call_lines, None
+
+
+def moves_run_forward(text):
+    """True when the loop acts on a text protocol response: it calls tools or ends the run"""
+    call_lines, final_line = read_protocol_lines(text)
+    return bool(call_lines) or final_line is not None
+
+
+def _worth_caching(response, tools=None):
+    # An off-format reply leaves the history unchanged, so the next iteration sends the same
+    # prompt: caching it would serve the same bad reply until max_iterations
+    if tools is not None:
+        return bool(extract_function_calls(response, {}) or extract_text(response))
+    return moves_run_forward(extract_text(response))
+
+
+async def generate_with_timeout(
+    prompt, timeout=10, tools=None, use_cache=True, timings=None, llm=None
+):
+    """Generate content with a timeout, waiting only when the rate limit budget is used up
+
+    The seconds spent waiting for the rate limiter and in the LLM call are added to the
+    `rate_limit_wait_seconds` and `llm_call_seconds` keys of `timings` when it is given.
+    `llm` replaces the shared model (e.g. one bound to a context-cached system prompt).
+    """
+    logger.debug("Starting LLM generation...")
+    if llm_replay is not None:
+        logger.debug("LLM response replayed from trace")
+        return llm_replay.response_for(prompt)
+
+    llm = llm or model
+    cache_key = LLMCache.make_key(_model_key(llm), prompt, tools)
+    cached = await asyncio.to_thread(llm_cache.get, cache_key) if use_cache else None
+    if cached is not None:
+        logger.info("LLM response served from cache")
+        return GenerateContentResponse.from_response(
+            genai.protos.GenerateContentResponse(cached)
+        )
+
+    attempt = 0
+    while True:
+        try:
+            started_at = time.perf_counter()
+            await rate_limiter.acquire(rate_limiter.estimate_tokens(prompt))
+            _add_timing(timings, "rate_limit_wait_seconds", started_at)
+            started_at = time.perf_counter()
+            try:
+                # The SDK gets the same timeout, so an abandoned call also stops on its side
+                response = await llm_executor.run(
+                    lambda: llm.generate_content(
+                        prompt, tools=tools, request_options={"timeout": timeout}
+                    ),
+                    timeout,
+                )
+            finally:
+                _add_timing(timings, "llm_call_seconds", started_at)
+            rate_limiter.report_success()
+            logger.debug("LLM generation completed")
+            if use_cache and _worth_caching(response, tools):
+                await asyncio.to_thread(llm_cache.put, cache_key, response.to_dict())
+            return response
+        except TimeoutError:
+            logger.error("LLM generation timed out!")
+            raise
+        except Exception as e:
+            if (
+                RateLimiter.is_rate_limit_error(e)
+                and attempt < max_rate_limit_retries
+            ):
+                attempt += 1
+                delay = rate_limiter.report_rate_limited()
+                logger.warning(
+                    "Rate limited by the LLM API, backing off for %.1fs...", delay
+                )
+                continue
+            logger.error("Error in LLM generation: %s", e)
+            raise
+
+
+def text_response_dict(text):
+    """The `to_dict()` form of a response made of a single text part"""
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+
+async def stream_lines(prompt, timeout=10, use_cache=True, timings=None, llm=None):
+    """Yield the lines of the LLM response as soon as each one is complete
+
+    Replayed and cached responses are yielded at once. Closing the generator (e.g. after
+    a FINAL_ANSWER line) stops reading the stream and the text read so far is cached,
+    as long as it has a FUNCTION_CALL or FINAL_ANSWER line.
+    `timings` and `llm` are used like in generate_with_timeout.
+    """
+    logger.debug("Starting streamed LLM generation...")
+    if llm_replay is not None:
+        logger.debug("LLM response replayed from trace")
+        for line in LineSplitter().feed(extract_text(llm_replay.response_for(prompt)) + "\n"):
+            yield line
+        return
+
+    llm = llm or model
+    cache_key = LLMCache.make_key(_model_key(llm), prompt)
+    cached = await asyncio.to_thread(llm_cache.get, cache_key) if use_cache else None
+    if cached is not None:
+        logger.info("LLM response served from cache")
+        response = GenerateContentResponse.from_response(
+            genai.protos.GenerateContentResponse(cached)
+        )
+        for line in LineSplitter().feed(extract_text(response) + "\n"):
+            yield line
+        return
+
+    attempt = 0
+    while True:
+        started_at = time.perf_counter()
+        await rate_limiter.acquire(rate_limiter.estimate_tokens(prompt))
+        _add_timing(timings, "rate_limit_wait_seconds", started_at)
+        started_at = time.perf_counter()
+        splitter = LineSplitter()
+        received = []
+        try:
+            async for chunk in stream_chunks(
+                lambda: llm.generate_content(
+                    prompt, stream=True, request_options={"timeout": timeout}
+                ),
+                timeout,
+                executor=llm_executor,
+            ):
+                received.append(chunk)
+                for line in splitter.feed(chunk):
+                    yield line
+            for line in splitter.flush():
+                yield line
+        except GeneratorExit:
+            # The caller has everything it needs, the rest of the generation is dropped
+            rate_limiter.report_success()
+            text = "".join(received)
+            if use_cache and moves_run_forward(text):
+                await asyncio.to_thread(llm_cache.put, cache_key, text_response_dict(text))
+            raise
+        except TimeoutError:
+            logger.error("LLM generation timed out!")
+            raise
+        except Exception as e:
+            if (
+                not received
+                and RateLimiter.is_rate_limit_error(e)
+                and attempt < max_rate_limit_retries
+            ):
+                attempt += 1
+                delay = rate_limiter.report_rate_limited()
+                logger.warning(
+                    "Rate limited by the LLM API, backing off for %.1fs...", delay
+                )
+                continue
+            logger.error("Error in LLM generation: %s", e)
+            raise
+        finally:
+            _add_timing(timings, "llm_call_seconds", started_at)
+        rate_limiter.report_success()
+        logger.debug("LLM generation completed")
+        text = "".join(received)
+        if use_cache and moves_run_forward(text):
+            await asyncio.to_thread(llm_cache.put, cache_key, text_response_dict(text))
+        return
+
+
+def parse_function_call(response_text, dispatch_table):
+    """Parse a `FUNCTION_CALL: name|p1|p2` line into the tool name and its typed arguments"""
+    _, function_info = response_text.split(":", 1)
+    parts = [p.strip() for p in function_info.split("|")]
+    func_name, params = parts[0], parts[1:]
+
+    logger.debug("Raw function info: %s", function_info)
+    logger.debug("Function name: %s", func_name)
+    logger.debug("Raw parameters: %s", params)
+
+    # The dispatch table holds the precompiled argument coercers of every tool
+    tool_spec = dispatch_table.get(func_name)
+    if tool_spec is None:
+        logger.debug("Available tools: %s", list(dispatch_table))
+        raise ValueError(f"Unknown tool: {func_name}")
+
+    return func_name, tool_spec.coerce_params(params)
+
+
+def _content_text(item):
+    """Text of a content item of a tool result"""
+    if hasattr(item, "text"):
+        return item.text
+    # Images and other binary items are only named, their data would flood the prompt
+    if hasattr(item, "mimeType"):
+        return f"<{item.type} {item.mimeType}>"
+    return str(item)
+
+
+async def execute_tool_call(session, func_name, arguments):
+    """Call a tool on the MCP server and format its result for the next prompt"""
+    logger.debug("Calling tool %s with arguments %s", func_name, arguments)
+
+    result = await session.call_tool(func_name, arguments=arguments)
+    logger.debug("Raw result: %s", result)
+
+    # Get the full result content
+    if hasattr(result, "content"):
+        # Handle multiple content items
+        if isinstance(result.content, list):
+            iteration_result = [_content_text(item) for item in result.content]
+        else:
+            iteration_result = str(result.content)
+    else:
+        logger.debug("Result has no content attribute")
+        iteration_result = str(result)
+
+    logger.info(
+        "Final iteration result: %s",
+        iteration_result,
+        extra={"color": "blue bold underline"},
+    )
+
+    # Format the response based on result type
+    if isinstance(iteration_result, list):
+        return f"[{', '.join(iteration_result)}]"
+    return str(iteration_result)
+
+
+@asynccontextmanager
+async def connect_to_server(server_script):
+    """Open the streams to the MCP server, spawning it over stdio unless MCP_SERVER_URL is set"""
+    if mcp_server_url:
+        async with sse_client(mcp_server_url) as (read, write):
+            yield read, write
+    else:
+        server_params = StdioServerParameters(command="python", args=[server_script])
+        async with stdio_client(server_params) as (read, write):
+            yield read, write
+
+
+def build_tools_description(tools):
+    """Describe every tool on its own line for the FUNCTION_CALL text protocol"""
+    try:
+        tools_description = []
+        for i, tool in enumerate(tools):
+            try:
+                # Get tool properties
+                params = tool.inputSchema
+                desc = getattr(tool, "description", "No description available")
+                name = getattr(tool, "name", f"tool_{i}")
+
+                # Format the input schema in a more readable way
+                if "properties" in params:
+                    param_details = []
+                    for param_name, param_info in params["properties"].items():
+                        param_type = param_info.get("type", "unknown")
+                        param_details.append(f"{param_name}: {param_type}")
+                    params_str = ", ".join(param_details)
+                else:
+                    params_str = "no parameters"
+
+                tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
+                tools_description.append(tool_desc)
+                logger.debug("Added description for tool: %s", tool_desc)
+            except Exception as e:
+                logger.error("Error processing tool %s: %s", i, e)
+                tools_description.append(f"{i+1}. Error processing tool")
+
+        tools_description = "\n".join(tools_description)
+        logger.debug("Successfully created tools description")
+    except Exception as e:
+        logger.error("Error creating tools description: %s", e)
+        tools_description = "Error loading tools"
+    return tools_description
+
+
+def build_system_prompt(tools_description):
+    """Render the system prompt of the FUNCTION_CALL text protocol"""
+    return f"""You are a math agent solving problems in iterations. You have access to various mathematical tools. Additionally, you also have access to a paint tool.
+
+Available tools:
+{tools_description}
+
+You must respond in one of these formats (no additional text):
+1. For function calls, EXACTLY ONE line per call:
+   FUNCTION_CALL: function_name|param1|param2|...
+   If you need several function calls that do not depend on each other's results, put each of them on its own FUNCTION_CALL line in the same response. They will be executed together.
+
+2. For final answers, EXACTLY ONE line:
+   FINAL_ANSWER: [number]
+
+Important:
+- When a function returns multiple values, you need to process all of them
+- Only give FINAL_ANSWER when you have completed all necessary calculations
+- If you are asked to display the answer in a paint tool, you must first use the paint tool and do that before giving out the final answer.
+- Do not repeat function calls with the same parameters
+- Remember that when you are providing a list as an argument for a function call, you need to provide it in the format [1, 2, 3]. DO NOT FORGET to add the square brackets.
+
+Examples:
+- FUNCTION_CALL: add|5|3
+- FUNCTION_CALL: strings_to_chars_to_int|INDIA
+- FUNCTION_CALL: summify_list|[1, 2, 3]
+- FUNCTION_CALL: listify_number|132
+  FUNCTION_CALL: listify_number|6
+- FINAL_ANSWER: [42]
+
+DO NOT include any explanations or additional text. Be very careful with selection of function calls and repeat the calls only when necessary.
+Every line of your response should start with either FUNCTION_CALL: or FINAL_ANSWER:"""
+
+
+# In native function calling mode the tools are passed as function declarations,
+# so the prompt no longer needs the tools block or the FUNCTION_CALL format
+NATIVE_SYSTEM_PROMPT = """You are a math agent solving problems in iterations. You have access to various mathematical tools, provided to you as functions. Additionally, you also have access to a paint tool.
+
+Call the functions you need to make progress on the task. You may request several independent function calls in a single turn.
+
+Important:
+- When a function returns multiple values, you need to process all of them
+- Only give the final answer when you have completed all necessary calculations
+- If you are asked to display the answer in a paint tool, you must first use the paint tool and do that before giving out the final answer.
+- Do not repeat function calls with the same parameters
+
+Once you are done, do not call any function and respond with EXACTLY ONE line:
+   FINAL_ANSWER: [number]"""
+
+
+def cached_model_for(system_prompt):
+    """Model whose system prompt is stored server side as gemini cached content
+
+    The cached content of a previous process is reused while it lives. Returns None when
+    context caching is not available (e.g. the prompt is below the minimum size of the model).
+    """
+    key = "gemini-context-" + hashlib.sha256(
+        f"{model.model_name}\n{system_prompt}".encode("utf-8")
+    ).hexdigest()
+    try:
+        name = prompt_cache.get(key)
+        if name is not None:
+            try:
+                return genai.GenerativeModel.from_cached_content(
+                    genai.caching.CachedContent.get(name)
+                )
+            except Exception:
+                logger.debug("Cached content %s expired, uploading it again", name)
+        cached_content = genai.caching.CachedContent.create(
+            model=model.model_name,
+            system_instruction=system_prompt,
+            ttl=gemini_context_cache_ttl,
+        )
+        prompt_cache.put(key, cached_content.name)
+        logger.info("System prompt uploaded as cached content %s", cached_content.name)
+        return genai.GenerativeModel.from_cached_content(cached_content)
+    except Exception as e:
+        logger.warning(
+            "Gemini context caching unavailable, sending the system prompt every time: %r", e
+        )
+        return None
+
+
+def is_cached_content_error(error: Exception) -> bool:
+    """Check whether a gemini call failed because its cached content expired or was deleted"""
+    message = f"{type(error).__name__} {error}".lower()
+    return "cachedcontent" in message or "cached content" in message
+
+
+class AgentContext:
+    """Everything the runs of one MCP session share: the session, tools and system prompt"""
+
+    # Part of the key of the cached tools descriptions, bump it when build_tools_description changes
+    tools_description_version = 1
+
+    def __init__(self, session, tools):
+        self.session = session
+        self.tools = tools
+        self.tools_hash = PromptCache.fingerprint(tools)
+        self.dispatch_table = build_dispatch_table(tools)
+        self.gemini_tools = build_gemini_tools(tools) if use_function_calling else None
+        # Model bound to the context-cached system prompt, None to use the shared model
+        self.llm = None
+        self._llm_lock = asyncio.Lock()
+
+        # Create system prompt with available tools
+        logger.debug("Creating system prompt for %d tools...", len(tools))
+        if use_function_calling:
+            self.system_prompt = NATIVE_SYSTEM_PROMPT
+        else:
+            # Same tools, same description: render it only once per tool list
+            self.system_prompt = build_system_prompt(
+                prompt_cache.get_or_render(
+                    f"tools-v{self.tools_description_version}-{self.tools_hash}",
+                    lambda: build_tools_description(tools),
+                )
+            )
+        logger.debug("Created system prompt")
+
+    @classmethod
+    async def create(cls, session) -> "AgentContext":
+        """Fetch the tools of an initialized session and prepare the shared state"""
+        logger.debug("Requesting tool list...")
+        tools_result = await session.list_tools()
+        tools = tools_result.tools
+        logger.info("Successfully retrieved %d tools", len(tools))
+        context = cls(session, tools)
+        # The native function calling mode passes the tools with every request, so it can't use it
+        if gemini_context_cache and not use_function_calling and llm_replay is None:
+            context.llm = await context._cached_model()
+        return context
+
+    async def _cached_model(self):
+        try:
+            return await llm_executor.run(lambda: cached_model_for(self.system_prompt), 30)
+        except TimeoutError:
+            logger.warning(
+                "Uploading the system prompt as cached content timed out, sending it every time"
+            )
+            return None
+
+    async def refresh_llm(self, failed_llm):
+        """Replace a model whose cached content is gone by uploading the system prompt again
+
+        Concurrent runs share the new model, and the system prompt goes back into every
+        prompt (llm None) if the upload fails.
+        """
+        async with self._llm_lock:
+            # Another run may already have replaced it
+            if self.llm is failed_llm:
+                self.llm = await self._cached_model()
+        return self.llm
+
+    def prompt_for(self, current_query):
+        """Prompt of an iteration, without the system prompt when the model already has it"""
+        if self.llm is not None:
+            return f"Query: {current_query}"
+        return f"{self.system_prompt}\n\nQuery: {current_query}"
+
+
+class AgentRun:
+    """State of the agent solving one query: iteration count, history and final answer"""
+
+    def __init__(self, context: AgentContext, query: str, run_id: int = 1):
+        self.context = context
+        self.query = query
+        self.run_id = run_id
+        self.iteration = 0
+        self.last_response = None
+        self.final_answer = None
+        self.conversation = ConversationHistory(query)
+        # One dict per iteration with its prompt size and where its time went
+        self.iteration_stats = []
+        self.trace = TraceRecorder.for_run(trace_dir, run_id) if trace_dir else None
+
+    def _record(self, event, **fields):
+        if self.trace is not None:
+            self.trace.record(event, run_id=self.run_id, **fields)
+
+    def _start_iteration(self) -> dict:
+        self._finish_iteration()
+        stats = {
+            "iteration": self.iteration + 1,
+            "prompt_bytes": 0,
+            "llm_seconds": 0.0,
+            "rate_limit_wait_seconds": 0.0,
+            "llm_call_seconds": 0.0,
+            "parse_seconds": 0.0,
+            "coercion_seconds": 0.0,
+            "tool_seconds": 0.0,
+            "tool_calls": 0,
+            "started_at": time.perf_counter(),
+        }
+        self.iteration_stats.append(stats)
+        return stats
+
+    def _finish_iteration(self):
+        if self.iteration_stats and "wall_seconds" not in self.iteration_stats[-1]:
+            stats = self.iteration_stats[-1]
+            stats["wall_seconds"] = time.perf_counter() - stats.pop("started_at")
+            self._record("iteration", **stats)
+            metrics.observe("agent_iteration_seconds", stats["wall_seconds"])
+            for key in (
+                "rate_limit_wait_seconds",
+                "llm_call_seconds",
+                "parse_seconds",
+                "coercion_seconds",
+            ):
+                metrics.observe(f"agent_{key}", stats[key])
+
+    async def _call_tool(self, func_name, arguments):
+        started_at = time.perf_counter()
+        try:
+            result_str = await execute_tool_call(self.context.session, func_name, arguments)
+        except Exception as e:
+            metrics.observe(
+                "agent_tool_call_seconds",
+                time.perf_counter() - started_at,
+                tool=func_name,
+                outcome="error",
+            )
+            self._record(
+                "tool",
+                iteration=self.iteration + 1,
+                tool=func_name,
+                arguments=arguments,
+                error=str(e),
+                seconds=time.perf_counter() - started_at,
+            )
+            raise
+        seconds = time.perf_counter() - started_at
+        metrics.observe(
+            "agent_tool_call_seconds", seconds, tool=func_name, outcome="ok"
+        )
+        self._record(
+            "tool",
+            iteration=self.iteration + 1,
+            tool=func_name,
+            arguments=arguments,
+            result=result_str,
+            seconds=seconds,
+        )
+        return result_str
+
+    async def _stream_response(self, prompt, stats, llm=None):
+        """Read the response line by line, starting the read-only tool calls as their lines complete
+
+        Tools with side effects (e.g. shoot_email) only run once the whole response is parsed:
+        a later line that fails to parse drops the whole batch, like in the non-streaming path,
+        and cancelling a task can't take back a call the server already received.
+        `llm` is the model the prompt was rendered for, like in generate_with_timeout.
+
+        Returns:
+            tuple[str, list, dict]: The text read, the parsed calls and the tasks of the calls
+                already started, by index in the calls (none when a debug hook has to see them first)
+        """
+        lines = []
+        function_calls = []
+        started = {}
+        parse_calls = True
+        start_calls = debug_hook is None
+        try:
+            async with aclosing(
+                stream_lines(prompt, timings=stats, llm=llm)
+            ) as stream:
+                async for line in stream:
+                    lines.append(line)
+                    if line.startswith("FINAL_ANSWER:"):
+                        # Nothing after the answer is used, stop the generation here
+                        break
+                    if line.startswith("FUNCTION_CALL:") and parse_calls:
+                        started_at = time.perf_counter()
+                        try:
+                            func_name, arguments = parse_function_call(
+                                line, self.context.dispatch_table
+                            )
+                        except Exception:
+                            # Reported when all the lines are parsed again after the stream
+                            parse_calls = False
+                            for task in started.values():
+                                task.cancel()
+                            function_calls, started = [], {}
+                            continue
+                        finally:
+                            stats["coercion_seconds"] += time.perf_counter() - started_at
+                        function_calls.append((func_name, arguments))
+                        if start_calls and self.context.dispatch_table[func_name].read_only:
+                            started[len(function_calls) - 1] = asyncio.create_task(
+                                self._call_tool(func_name, arguments)
+                            )
+        except BaseException:
+            for task in started.values():
+                task.cancel()
+            raise
+        return "\n".join(lines), function_calls, started
+
+    async def run(self):
+        """Run the agent loop until a final answer, an error or max_iterations
+
+        Returns:
+            str: The FINAL_ANSWER line of the LLM, or None if the run did not finish
+        """
+        logger.debug("Starting iteration loop for run %s...", self.run_id)
+        self._record("run", query=self.query)
+        try:
+            return await self._loop()
+        finally:
+            self._finish_iteration()
+            self._record("final", final_answer=self.final_answer)
+            if self.trace is not None:
+                self.trace.close()
+            if metrics_path:
+                metrics.export(metrics_path)
+
+    async def _loop(self):
+        context = self.context
+        # Iteration retried after its cached content expired, so a refresh is tried once per iteration
+        refreshed_iteration = None
+
+        while self.iteration < max_iterations:
+            logger.info("--- Run %s, iteration %d ---", self.run_id, self.iteration + 1)
+            stats = self._start_iteration()
+            # Render the query plus each previous result once, in linear time
+            current_query = self.conversation.render()
+
+            # Get model's response with timeout
+            llm = context.llm
+            prompt = context.prompt_for(current_query)
+            stats["prompt_bytes"] = len(prompt.encode("utf-8"))
+            function_calls = []
+            call_lines = []
+            started = {}
+            try:
+                llm_started_at = time.perf_counter()
+                streaming = use_streaming and not use_function_calling
+                if streaming:
+                    response_text, function_calls, started = await self._stream_response(
+                        prompt, stats, llm
+                    )
+                else:
+                    response = await generate_with_timeout(
+                        prompt, tools=context.gemini_tools, timings=stats, llm=llm
+                    )
+                stats["llm_seconds"] = time.perf_counter() - llm_started_at
+                if self.trace is not None:
+                    self._record(
+                        "llm",
+                        iteration=self.iteration + 1,
+                        prompt_hash=prompt_hash(prompt),
+                        prompt_bytes=stats["prompt_bytes"],
+                        response=(
+                            text_response_dict(response_text)
+                            if streaming
+                            else response.to_dict()
+                        ),
+                        seconds=stats["llm_seconds"],
+                    )
+
+                started_at = time.perf_counter()
+                if use_function_calling:
+                    function_calls = extract_function_calls(
+                        response, context.dispatch_table
+                    )
+                    stats["coercion_seconds"] += time.perf_counter() - started_at
+                    started_at = time.perf_counter()
+                    response_text = extract_text(response)
+                elif not streaming:
+                    response_text = response.text.strip()
+
+                # Find the FUNCTION_CALL lines in the response, one per independent call
+                call_lines, final_line = read_protocol_lines(response_text)
+                stats["parse_seconds"] += time.perf_counter() - started_at
+
+                logger.info(
+                    "LLM Response: %s", response_text, extra={"color": "green bold"}
+                )
+                if function_calls:
+                    logger.info(
+                        "LLM Function calls: %s",
+                        function_calls,
+                        extra={"color": "green bold"},
+                    )
+
+            except Exception as e:
+                if (
+                    llm is not None
+                    and refreshed_iteration != self.iteration
+                    and is_cached_content_error(e)
+                ):
+                    # The cached content outlived its TTL in a long-lived session
+                    logger.warning("Cached system prompt is gone, uploading it again: %s", e)
+                    refreshed_iteration = self.iteration
+                    await context.refresh_llm(llm)
+                    continue
+                logger.error("Failed to get LLM response: %s", e)
+                break
+
+            if function_calls or call_lines:
+                try:
+                    if not function_calls:
+                        started_at = time.perf_counter()
+                        function_calls = [
+                            parse_function_call(line, context.dispatch_table)
+                            for line in call_lines
+                        ]
+                        stats["coercion_seconds"] += time.perf_counter() - started_at
+
+                    if debug_hook is not None:
+                        await debug_hook(self, function_calls)
+
+                    # The calls are independent, so run them concurrently over the single session
+                    tool_started_at = time.perf_counter()
+                    results = await asyncio.gather(
+                        *(
+                            started.get(i) or self._call_tool(func_name, arguments)
+                            for i, (func_name, arguments) in enumerate(function_calls)
+                        )
+                    )
+                    stats["tool_seconds"] = time.perf_counter() - tool_started_at
+                    stats["tool_calls"] = len(function_calls)
+                    self.conversation.append_calls(
+                        self.iteration + 1,
+                        [
+                            (func_name, arguments, result_str)
+                            for (func_name, arguments), result_str in zip(
+                                function_calls, results
+                            )
+                        ],
+                    )
+                    self.last_response = results[-1]
+
+                except Exception as e:
+                    logger.exception("Error in run %s: %s", self.run_id, e)
+                    for task in started.values():
+                        task.cancel()
+                    self.conversation.append(
+                        f"Error in iteration {self.iteration + 1}: {str(e)}"
+                    )
+                    break
+
+            elif final_line is not None or use_function_calling:
+                self.final_answer = final_line if final_line is not None else response_text
+                logger.info(
+                    "=== Agent Execution Complete (run %s) ===",
+                    self.run_id,
+                    extra={"color": "yellow"},
+                )
+                break
+
+            self.iteration += 1
+
+        return self.final_answer
+
+
+async def _numbered(queries):
+    """Number the queries of a list or of an (async) stream"""
+    run_id = 0
+    if hasattr(queries, "__aiter__"):
+        async for query in queries:
+            run_id += 1
+            yield run_id, query
+    else:
+        for query in queries:
+            run_id += 1
+            yield run_id, query
+
+
+async def run_queries(context, queries, concurrency=None, run_class=AgentRun):
+    """Solve many queries over one session, at most `concurrency` of them at a time
+
+    Args:
+        context (AgentContext): Session, tools and system prompt shared by the runs
+        queries: A list of queries, or an async iterable streaming them
+        concurrency (int, optional): Maximum number of concurrent runs (AGENT_CONCURRENCY)
+        run_class (type): AgentRun subclass to use for each query
+
+    Returns:
+        list: The final answer of each query (None for the runs that did not finish), in order
+    """
+    semaphore = asyncio.Semaphore(concurrency or agent_concurrency)
+
+    async def run_one(run_id, query):
+        try:
+            return await run_class(context, query, run_id=run_id).run()
+        except Exception as e:
+            logger.exception("Error in run %s: %s", run_id, e)
+            return None
+        finally:
+            semaphore.release()
+
+    tasks = []
+    async for run_id, query in _numbered(queries):
+        # Wait for a free slot before pulling the next query from the stream
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(run_one(run_id, query)))
+    return await asyncio.gather(*tasks)
+
+
+async def run_agent(queries, server_script, concurrency=None, run_class=AgentRun):
+    """Connect to the MCP server and solve all the queries over a single session"""
+    try:
+        # Create a single MCP server connection
+        logger.debug("Establishing connection to MCP server...")
+        async with connect_to_server(server_script) as (read, write):
+            logger.debug("Connection established, creating session...")
+            async with ClientSession(read, write) as session:
+                logger.debug("Session created, initializing...")
+                await session.initialize()
+
+                context = await AgentContext.create(session)
+                return await run_queries(
+                    context, queries, concurrency=concurrency, run_class=run_class
+                )
+
+    except Exception as e:
+        logger.exception("Error in main execution: %s", e)
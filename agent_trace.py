@@ -0,0 +1,88 @@
+"""Structured JSONL traces of agent runs, and replay of the recorded LLM responses.
+
+Unlike `logs/llm_logs.log`, which is captured stdout, a trace holds one JSON
+object per line: the query of the run, every LLM call (prompt hash and size,
+response, timing), every tool call (name, arguments, result, timing) and the
+per-iteration stats. Feeding the LLM responses back in place of Gemini makes
+runs deterministic, for performance regression tests and offline profiling of
+the tool path.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import google.generativeai as genai
+from google.generativeai.types.generation_types import GenerateContentResponse
+
+
+def prompt_hash(prompt) -> str:
+    """Stable id of a prompt"""
+    return hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()
+
+
+class TraceRecorder:
+    """Appends the events of one run to a JSONL file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(cls, trace_dir: str, run_id) -> "TraceRecorder":
+        """Create the trace file of a run in `trace_dir`"""
+        os.makedirs(trace_dir, exist_ok=True)
+        name = f"run-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{run_id}.jsonl"
+        return cls(os.path.join(trace_dir, name))
+
+    def record(self, event: str, **fields):
+        line = json.dumps({"event": event, "time": time.time(), **fields}, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_trace(path: str) -> list[dict]:
+    """Load the events of a trace file"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class LLMReplay:
+    """Serves recorded LLM responses by prompt hash instead of calling Gemini"""
+
+    def __init__(self, events: list[dict]):
+        self.queries = []
+        self._responses = {}
+        for event in events:
+            if event["event"] == "run":
+                self.queries.append(event["query"])
+            elif event["event"] == "llm":
+                self._responses.setdefault(event["prompt_hash"], event["response"])
+
+    @classmethod
+    def from_files(cls, paths: list[str]) -> "LLMReplay":
+        events = []
+        for path in paths:
+            events.extend(read_trace(path))
+        return cls(events)
+
+    def response_for(self, prompt) -> GenerateContentResponse:
+        """Return the response recorded for exactly this prompt
+
+        Raises:
+            KeyError: If the prompt was never recorded, i.e. the run diverged from the trace
+        """
+        key = prompt_hash(prompt)
+        if key not in self._responses:
+            raise KeyError(f"No recorded LLM response for prompt {key[:12]}")
+        return GenerateContentResponse.from_response(
+            genai.protos.GenerateContentResponse(self._responses[key])
+        )
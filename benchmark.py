@@ -0,0 +1,286 @@
+"""Offline benchmark of the agent loop.
+
+Drives `run_agent` with a scripted stand-in for Gemini against the real MCP server
+over stdio, so it needs no network and no API key. Reports the wall time per
+iteration (p50/p95), how it splits between the LLM and the tools, the number of
+iterations needed to reach FINAL_ANSWER and the prompt bytes sent per iteration.
+With --replay, the queries and LLM responses come from recorded traces instead.
+
+Usage:
+    python benchmark.py --runs 20 --concurrency 4 --json bench.json
+    python benchmark.py --replay traces/run-*.jsonl
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+
+os.environ.setdefault("MODEL_NAME", "gemini-2.0-flash")
+
+import google.generativeai as genai
+from google.generativeai.types.generation_types import GenerateContentResponse
+
+import agent
+from agent import AgentRun, run_agent
+from rate_limiter import RateLimiter
+from agent_trace import LLMReplay
+from log_config import setup_logging
+
+
+def make_response(text: str) -> GenerateContentResponse:
+    """Wrap a text in the response type returned by `model.generate_content`"""
+    return GenerateContentResponse.from_response(
+        genai.protos.GenerateContentResponse(
+            candidates=[{"content": {"parts": [{"text": text}], "role": "model"}}]
+        )
+    )
+
+
+class ScriptedModel:
+    """Stand-in for `genai.GenerativeModel` replying from a fixed script per query.
+
+    The reply to a prompt is the n-th line of the script of its query, where n is the
+    number of iterations already recorded (verbatim or summarized) in the prompt. Streamed replies arrive in
+    chunks of `chunk_size` characters, with the latency spread over the chunks.
+    """
+
+    model_name = "scripted"
+
+    chunk_size = 16
+
+    def __init__(self, scripts: dict, latency: float = 0.0):
+        self.scripts = scripts
+        self.latency = latency
+
+    def _reply(self, prompt) -> str:
+        current_query = prompt.split("\n\nQuery: ", 1)[-1]
+        for query, script in self.scripts.items():
+            if current_query.startswith(query):
+                summarized = re.search(r"Summary of the first (\d+) iterations", current_query)
+                step = current_query.count("In iteration ") + (
+                    int(summarized.group(1)) if summarized else 0
+                )
+                return script[min(step, len(script) - 1)]
+        raise ValueError("No script for this prompt")
+
+    def _stream(self, reply: str):
+        chunks = [
+            reply[i : i + self.chunk_size] for i in range(0, len(reply), self.chunk_size)
+        ]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield make_response(chunk)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        reply = self._reply(prompt)
+        if stream:
+            return self._stream(reply)
+        if self.latency:
+            time.sleep(self.latency)
+        return make_response(reply)
+
+
+def digit_sum_query(a: int, b: int) -> str:
+    return f"""TASK:
+    Given two positive integers A and B, you can only perform the following operation:
+        Replace A with the sum of its digits
+    Check if you can make A equal to B by performing the above operation any number of times. If yes, then say "YES, A can be made equal to B" and if not then say "NO, A can never be made equal to B".
+    A is {a} and B is {b}
+    """
+
+
+def digit_sum_script(a: int, b: int) -> list[str]:
+    """The FUNCTION_CALL lines a well behaved model sends to solve `digit_sum_query`"""
+    script = []
+    trajectory = [a]
+    while a > 9:
+        digits = [int(digit) for digit in str(a)]
+        script.append(f"FUNCTION_CALL: listify_number|{a}")
+        script.append(f"FUNCTION_CALL: summify_list|{digits}")
+        a = sum(digits)
+        trajectory.append(a)
+    script.append(f"FUNCTION_CALL: check_integer_equality|{a}|{b}")
+    answer = "YES" if b in trajectory else "NO"
+    script.append(f"FINAL_ANSWER: [{answer}]")
+    return script
+
+
+class BenchmarkRun(AgentRun):
+    """AgentRun keeping track of every instance so their stats can be aggregated"""
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        BenchmarkRun.instances.append(self)
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile (q between 0 and 100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(runs: list, elapsed: float) -> dict:
+    """Aggregate the iteration stats of the runs"""
+    iterations = [stats for run in runs for stats in run.iteration_stats]
+    wall = [stats["wall_seconds"] for stats in iterations]
+    llm = [stats["llm_seconds"] for stats in iterations]
+    tool = [stats["tool_seconds"] for stats in iterations]
+    finished = [run for run in runs if run.final_answer is not None]
+    iterations_to_answer = [len(run.iteration_stats) for run in finished]
+    prompt_bytes = [stats["prompt_bytes"] for stats in iterations]
+    return {
+        "runs": len(runs),
+        "finished_runs": len(finished),
+        "elapsed_seconds": elapsed,
+        "runs_per_second": len(runs) / elapsed if elapsed else 0.0,
+        "iterations": len(iterations),
+        "iteration_wall_p50": percentile(wall, 50),
+        "iteration_wall_p95": percentile(wall, 95),
+        "llm_seconds_total": sum(llm),
+        "tool_seconds_total": sum(tool),
+        "other_seconds_total": sum(wall) - sum(llm) - sum(tool),
+        "rate_limit_wait_seconds_total": sum(
+            stats["rate_limit_wait_seconds"] for stats in iterations
+        ),
+        "llm_call_seconds_total": sum(stats["llm_call_seconds"] for stats in iterations),
+        "parse_seconds_total": sum(stats["parse_seconds"] for stats in iterations),
+        "coercion_seconds_total": sum(stats["coercion_seconds"] for stats in iterations),
+        "iterations_to_answer_mean": (
+            sum(iterations_to_answer) / len(iterations_to_answer)
+            if iterations_to_answer
+            else 0.0
+        ),
+        "iterations_to_answer_max": max(iterations_to_answer, default=0),
+        "prompt_bytes_p50": percentile(prompt_bytes, 50),
+        "prompt_bytes_max": max(prompt_bytes, default=0),
+        "prompt_bytes_per_iteration": [
+            percentile(
+                [
+                    stats["prompt_bytes"]
+                    for stats in iterations
+                    if stats["iteration"] == number
+                ],
+                50,
+            )
+            for number in range(1, max((s["iteration"] for s in iterations), default=0) + 1)
+        ],
+    }
+
+
+def print_report(summary: dict):
+    print("\n=== Benchmark ===")
+    print(f"Runs finished:             {summary['finished_runs']}/{summary['runs']}")
+    print(
+        f"Elapsed:                   {summary['elapsed_seconds']:.3f}s "
+        f"({summary['runs_per_second']:.2f} runs/s)"
+    )
+    print(
+        f"Iteration wall time:       p50 {summary['iteration_wall_p50'] * 1000:.1f}ms, "
+        f"p95 {summary['iteration_wall_p95'] * 1000:.1f}ms"
+    )
+    print(
+        f"Time split:                LLM {summary['llm_seconds_total']:.3f}s, "
+        f"tools {summary['tool_seconds_total']:.3f}s, "
+        f"other {summary['other_seconds_total']:.3f}s"
+    )
+    print(
+        f"LLM and parsing:           rate limit wait {summary['rate_limit_wait_seconds_total']:.3f}s, "
+        f"call {summary['llm_call_seconds_total']:.3f}s, "
+        f"parse {summary['parse_seconds_total'] * 1000:.1f}ms, "
+        f"coercion {summary['coercion_seconds_total'] * 1000:.1f}ms"
+    )
+    print(
+        f"Iterations to answer:      mean {summary['iterations_to_answer_mean']:.2f}, "
+        f"max {summary['iterations_to_answer_max']}"
+    )
+    print(
+        f"Prompt bytes per iteration (p50): {summary['prompt_bytes_per_iteration']}"
+    )
+
+
+async def benchmark(
+    runs: int,
+    concurrency: int,
+    server: str,
+    latency: float,
+    seed: int,
+    replay=None,
+    stream=False,
+):
+    if replay:
+        # The recorded runs decide the queries, the responses and the protocol
+        agent.llm_replay = LLMReplay.from_files(replay)
+        queries = agent.llm_replay.queries
+    else:
+        rng = random.Random(seed)
+        scripts = {}
+        for _ in range(runs):
+            a, b = rng.randint(10, 10**6), rng.randint(1, 9)
+            # Every query must be unique for the scripted model to find its script
+            while digit_sum_query(a, b) in scripts:
+                a += 1
+            scripts[digit_sum_query(a, b)] = digit_sum_script(a, b)
+        queries = list(scripts)
+
+        # No network: scripted model, no cache, no rate limit and the text protocol
+        agent.model = ScriptedModel(scripts, latency=latency)
+        agent.llm_cache.enabled = False
+        agent.rate_limiter = RateLimiter(requests_per_minute=1e9, tokens_per_minute=1e12)
+        agent.use_function_calling = False
+    agent.use_streaming = stream
+
+    BenchmarkRun.instances = []
+    started_at = time.perf_counter()
+    await run_agent(queries, server, concurrency=concurrency, run_class=BenchmarkRun)
+    return summarize(BenchmarkRun.instances, time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10, help="number of queries")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent runs")
+    parser.add_argument("--server", default="mcp_server.py", help="MCP server script")
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument(
+        "--replay", nargs="+", metavar="TRACE", help="replay the runs of these traces"
+    )
+    parser.add_argument(
+        "--stream", action="store_true", help="stream the LLM responses (USE_STREAMING)"
+    )
+    args = parser.parse_args()
+    # The per-iteration logs of the agent would drown the report
+    setup_logging(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+
+    summary = asyncio.run(
+        benchmark(
+            args.runs,
+            args.concurrency,
+            args.server,
+            args.llm_latency,
+            args.seed,
+            replay=args.replay,
+            stream=args.stream,
+        )
+    )
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
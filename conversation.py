@@ -0,0 +1,115 @@
+import os
+from collections import deque
+from rate_limiter import RateLimiter
+
+
+def format_call(func_name: str, arguments: dict) -> str:
+    """Compact form of a tool call, e.g. `listify_number(a=132)`"""
+    return f"{func_name}({', '.join(f'{k}={v}' for k, v in arguments.items())})"
+
+
+class ConversationHistory:
+    """Structured history of an agent run.
+
+    Each tool result is appended exactly once and the prompt is rendered in
+    linear time from the original query plus the stored entries. The history is
+    kept within a budget of `max_tokens` tokens, as counted by `count_tokens` (by
+    default the same estimate the rate limiter charges the prompt with):
+    when it would go over, the oldest iterations are collapsed into a compact
+    summary of the facts they established (e.g. `listify_number(a=132) = [1, 3, 2]`),
+    so the prompt stays flat instead of growing with the number of iterations.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        max_tokens: int = None,
+        separator: str = " ",
+        count_tokens=RateLimiter.estimate_tokens,
+    ):
+        self.query = query
+        if max_tokens is None:
+            if os.getenv("HISTORY_MAX_TOKENS"):
+                max_tokens = int(os.getenv("HISTORY_MAX_TOKENS"))
+            else:
+                # HISTORY_MAX_CHARS is the budget of older versions, in characters
+                max_tokens = int(os.getenv("HISTORY_MAX_CHARS", 20000)) // 4
+        self.max_tokens = max_tokens
+        self.separator = separator
+        self.count_tokens = count_tokens
+        # (text, facts) of the iterations still rendered verbatim
+        self.entries = deque()
+        # Facts of the summarized iterations, in order and without duplicates
+        self.facts = {}
+        self.dropped = 0
+        self.dropped_facts = 0
+        self._tokens = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return (text for text, _ in self.entries)
+
+    def append(self, entry: str, facts=()):
+        """Add the outcome of one iteration to the history
+
+        Args:
+            entry (str): Text rendered while the iteration is recent
+            facts (list[str]): What the iteration established, kept once it is summarized
+        """
+        entry = str(entry)
+        self.entries.append((entry, list(facts)))
+        self._tokens += self.count_tokens(entry + self.separator)
+        self._compact()
+
+    def append_calls(self, iteration: int, calls):
+        """Add the tool calls of an iteration, as (name, arguments, result) triples"""
+        calls_summary = "; ".join(
+            f"you called {func_name} with {arguments} parameters, "
+            f"and the function returned {result}"
+            for func_name, arguments, result in calls
+        )
+        self.append(
+            f"In iteration {iteration} {calls_summary}.\n",
+            [
+                f"{format_call(func_name, arguments)} = {result}"
+                for func_name, arguments, result in calls
+            ],
+        )
+
+    def _compact(self):
+        # Summarize the oldest iterations once we go over budget, but always keep the latest one
+        while self._tokens > self.max_tokens and len(self.entries) > 1:
+            text, facts = self.entries.popleft()
+            self._tokens -= self.count_tokens(text + self.separator)
+            self.dropped += 1
+            for fact in facts:
+                if fact not in self.facts:
+                    self.facts[fact] = None
+                    self._tokens += self.count_tokens(fact + "; ")
+        # Even the summary has to fit, forget the oldest facts if it doesn't
+        while self._tokens > self.max_tokens and self.facts:
+            fact = next(iter(self.facts))
+            del self.facts[fact]
+            self._tokens -= self.count_tokens(fact + "; ")
+            self.dropped_facts += 1
+
+    def estimate_tokens(self) -> int:
+        """Token count of the query plus the rendered history"""
+        return self.count_tokens(self.query) + self._tokens
+
+    def render(self, suffix: str = "  What should I do next?") -> str:
+        """Render the query, the summary of the older iterations and the recent ones verbatim"""
+        if not self.entries:
+            return self.query
+        parts = [self.query, "\n\n"]
+        if self.dropped:
+            parts.append(f"Summary of the first {self.dropped} iterations: ")
+            if self.dropped_facts:
+                parts.append(f"({self.dropped_facts} older results omitted) ")
+            parts.append("; ".join(self.facts))
+            parts.append(".\n")
+        parts.append(self.separator.join(text for text, _ in self.entries))
+        parts.append(suffix)
+        return "".join(parts)
@@ -0,0 +1,216 @@
+import os
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from send_email import send_emails
+from sqlite_store import connect
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class EmailQueue:
+    """Durable outbound email queue stored in SQLite.
+
+    Every message is written to disk before `enqueue` returns, so a crash of the
+    MCP server never loses mail. Messages that were being sent when the process
+    died are put back in the queue the next time it is opened.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        max_attempts: int = 5,
+        base_backoff: float = 5.0,
+        max_backoff: float = 600.0,
+    ):
+        if path is None:
+            path = os.getenv(
+                "EMAIL_QUEUE_PATH",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "email_queue.db"),
+            )
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        with self._connect() as db:
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS emails (
+                    id TEXT PRIMARY KEY,
+                    recipient_email TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS emails_due ON emails (status, next_attempt_at)"
+            )
+            # Recover the messages a previous process was sending when it died
+            db.execute(
+                "UPDATE emails SET status = ? WHERE status = ?", (QUEUED, SENDING)
+            )
+
+    def _connect(self):
+        # WAL lets the worker thread read the queue while the tools enqueue new messages
+        return connect(self.path, wal=True, row_factory=sqlite3.Row)
+
+    def enqueue(self, recipient_email: str, subject: str, body: str) -> str:
+        """Persist a message and return its id"""
+        message_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                """INSERT INTO emails (id, recipient_email, subject, body, status,
+                    next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (message_id, recipient_email, subject, body, QUEUED, now, now, now),
+            )
+        return message_id
+
+    def claim_due(self, limit: int = 20) -> list[dict]:
+        """Mark up to `limit` due messages as being sent and return them"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                """SELECT * FROM emails WHERE status = ? AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?""",
+                (QUEUED, now, limit),
+            ).fetchall()
+            db.executemany(
+                "UPDATE emails SET status = ?, updated_at = ? WHERE id = ?",
+                [(SENDING, now, row["id"]) for row in rows],
+            )
+        return [dict(row) for row in rows]
+
+    def mark_sent(self, message_id: str):
+        """Record a successful delivery"""
+        with self._connect() as db:
+            db.execute(
+                """UPDATE emails SET status = ?, attempts = attempts + 1,
+                    last_error = NULL, updated_at = ? WHERE id = ?""",
+                (SENT, time.time(), message_id),
+            )
+
+    def mark_failed(self, message_id: str, error: str):
+        """Schedule a retry with exponential backoff, or give up after `max_attempts`"""
+        now = time.time()
+        with self._connect() as db:
+            (attempts,) = db.execute(
+                "SELECT attempts + 1 FROM emails WHERE id = ?", (message_id,)
+            ).fetchone()
+            status = FAILED if attempts >= self.max_attempts else QUEUED
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+            db.execute(
+                """UPDATE emails SET status = ?, attempts = ?, next_attempt_at = ?,
+                    last_error = ?, updated_at = ? WHERE id = ?""",
+                (status, attempts, now + delay, error, now, message_id),
+            )
+
+    def next_due_in(self) -> float:
+        """Seconds until the next queued message is due (None when the queue is empty)"""
+        with self._connect() as db:
+            (next_attempt_at,) = db.execute(
+                "SELECT MIN(next_attempt_at) FROM emails WHERE status = ?", (QUEUED,)
+            ).fetchone()
+        if next_attempt_at is None:
+            return None
+        return max(0.0, next_attempt_at - time.time())
+
+    def status(self, message_id: str) -> dict:
+        """Return the delivery status of a message, or None if the id is unknown"""
+        with self._connect() as db:
+            row = db.execute(
+                """SELECT id, recipient_email, subject, status, attempts, last_error,
+                    created_at, updated_at FROM emails WHERE id = ?""",
+                (message_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+
+class EmailWorker:
+    """Background thread draining an EmailQueue in batches over one SMTP session"""
+
+    def __init__(self, queue: EmailQueue, batch_size: int = 20, poll_interval: float = 30):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread if it isn't running yet"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="email-worker", daemon=True
+            )
+            self._thread.start()
+
+    def notify(self):
+        """Wake the worker up because a new message was enqueued"""
+        self.start()
+        self._wakeup.set()
+
+    def stop(self, timeout: float = None):
+        """Stop the worker thread, messages left in the queue are sent on the next start"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def drain_once(self) -> int:
+        """Send one batch of due messages, return how many were attempted"""
+        batch = self.queue.claim_due(self.batch_size)
+        if not batch:
+            return 0
+        try:
+            results = send_emails(
+                [
+                    dict(
+                        recipient_email=message["recipient_email"],
+                        subject=message["subject"],
+                        query_answer=message["body"],
+                    )
+                    for message in batch
+                ]
+            )
+            errors = [
+                None if sent else "The SMTP server did not accept the email"
+                for sent in results
+            ]
+        except Exception as e:
+            errors = [str(e)] * len(batch)
+        for message, error in zip(batch, errors):
+            if error is None:
+                self.queue.mark_sent(message["id"])
+            else:
+                self.queue.mark_failed(message["id"], error)
+        return len(batch)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                while self.drain_once():
+                    pass
+                wait = self.queue.next_due_in()
+            except Exception as e:
+                logger.exception("Error in email worker: %s", e)
+                wait = None
+            if wait is None:
+                wait = self.poll_interval
+            self._wakeup.wait(min(wait, self.poll_interval))
+            self._wakeup.clear()
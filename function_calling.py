@@ -0,0 +1,103 @@
+"""Helpers for Gemini's native function calling.
+
+Instead of describing the tools in the prompt and parsing `FUNCTION_CALL: name|p1|p2`
+lines, the MCP `tool.inputSchema` objects are handed to Gemini as function
+declarations and the structured function-call parts are read back from the response.
+"""
+
+# Keys of a JSON schema that Gemini's Schema proto understands
+SUPPORTED_SCHEMA_KEYS = {
+    "type",
+    "format",
+    "description",
+    "nullable",
+    "enum",
+    "items",
+    "properties",
+    "required",
+}
+
+
+def schema_to_gemini(schema: dict) -> dict:
+    """Convert an MCP (JSON schema) input schema into the subset Gemini accepts
+
+    Args:
+        schema (dict): JSON schema of a tool argument, as generated by FastMCP
+
+    Returns:
+        dict: Schema stripped of unsupported keys (title, additionalProperties, ...)
+    """
+    converted = {
+        key: value for key, value in schema.items() if key in SUPPORTED_SCHEMA_KEYS
+    }
+    if "type" not in converted:
+        # e.g. an `anyOf` or an untyped list item, fall back to a plain string
+        converted["type"] = "string"
+    if converted["type"] == "object":
+        properties = converted.get("properties", {})
+        if not properties:
+            # Gemini rejects objects without properties
+            return {"type": "string", "description": schema.get("description", "")}
+        converted["properties"] = {
+            name: schema_to_gemini(value) for name, value in properties.items()
+        }
+    if converted["type"] == "array":
+        items = converted.get("items") or {"type": "number"}
+        converted["items"] = schema_to_gemini(items)
+    return converted
+
+
+def build_function_declarations(tools) -> list[dict]:
+    """Build Gemini function declarations from the MCP tools returned by `list_tools()`"""
+    declarations = []
+    for tool in tools:
+        declaration = {
+            "name": tool.name,
+            "description": getattr(tool, "description", None) or tool.name,
+        }
+        if tool.inputSchema.get("properties"):
+            declaration["parameters"] = schema_to_gemini(tool.inputSchema)
+        declarations.append(declaration)
+    return declarations
+
+
+def build_gemini_tools(tools) -> list[dict]:
+    """Wrap the function declarations in the `tools` argument of `generate_content`"""
+    return [{"function_declarations": build_function_declarations(tools)}]
+
+
+def _response_parts(response):
+    """Parts of the first candidate (slicing `candidates` would yield raw protobufs)"""
+    if not response.candidates:
+        return []
+    return response.candidates[0].content.parts
+
+
+def extract_function_calls(response, dispatch_table) -> list[tuple[str, dict]]:
+    """Read all function-call parts of a Gemini response
+
+    Args:
+        response: The `GenerateContentResponse` returned by `generate_content`
+        dispatch_table (dict): Tool name to ToolSpec, used to restore the argument types
+            (Gemini returns every JSON number as a float)
+
+    Returns:
+        list[tuple[str, dict]]: (function name, arguments) for every requested call, in order
+    """
+    function_calls = []
+    for part in _response_parts(response):
+        function_call = part.function_call
+        if not function_call or not function_call.name:
+            continue
+        name = function_call.name
+        # to_dict turns the proto Struct into plain python dicts and lists
+        arguments = type(function_call).to_dict(function_call).get("args") or {}
+        if name in dispatch_table:
+            arguments = dispatch_table[name].coerce_arguments(arguments)
+        function_calls.append((name, arguments))
+    return function_calls
+
+
+def extract_text(response) -> str:
+    """Return the text parts of a Gemini response (`response.text` raises on function calls)"""
+    return "".join(part.text for part in _response_parts(response) if part.text).strip()
@@ -1,5 +1,4 @@
 import tkinter as tk
-import time
 
 def open_paint_with_text(text):
     root = tk.Tk()
@@ -13,15 +12,13 @@ def open_paint_with_text(text):
 
     rect_x1, rect_y1 = canvas_width // 4, canvas_height // 3
     rect_x2, rect_y2 = 3 * canvas_width // 4, 2 * canvas_height // 3
-    
-    time.sleep(3)
+
     print("Creating Rectangle")
 
     canvas.create_rectangle(
         rect_x1, rect_y1, rect_x2, rect_y2, fill="lightblue", outline="black"
     )
 
-    time.sleep(3)
     print("Creating Text")
 
     canvas.create_text(
@@ -36,4 +33,5 @@ def open_paint_with_text(text):
 
 
 # Example usage
-open_paint_with_text("Hello, World!")
+if __name__ == "__main__":
+    open_paint_with_text("Hello, World!")
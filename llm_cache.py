@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlite_store import connect
+
+
+class LLMCache:
+    """Content-addressed cache of LLM responses.
+
+    Responses are keyed on a hash of the model name, the prompt and the tools passed
+    to the model. They live in an in-memory LRU and, when `path` is set, in a SQLite
+    file so that replayed runs skip the network entirely. Entries older than `ttl`
+    seconds are ignored and the oldest ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        max_entries: int = 1024,
+        ttl: float = 7 * 24 * 3600,
+        enabled: bool = True,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path:
+            with self._connect() as db:
+                db.execute(
+                    """CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )"""
+                )
+
+    @classmethod
+    def from_env(cls) -> "LLMCache":
+        """Build a cache from LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL and LLM_CACHE_BYPASS"""
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH") or None,
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024)),
+            ttl=float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600)),
+            enabled=os.getenv("LLM_CACHE_BYPASS", "0").lower() not in ("1", "true", "yes"),
+        )
+
+    def _connect(self):
+        return connect(self.path)
+
+    @staticmethod
+    def make_key(model_name: str, prompt, tools=None) -> str:
+        """Hash everything that determines the response of the model"""
+        payload = json.dumps(
+            {"model": model_name, "prompt": prompt, "tools": tools},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: str):
+        """Return the cached value for `key`, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+        if self.path:
+            with self._connect() as db:
+                row = db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    db.execute(
+                        "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.hits += 1
+                    return value
+        self.misses += 1
+        return None
+
+    def _remember(self, key: str, value, created_at: float):
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, value):
+        """Store a JSON-serializable value"""
+        if not self.enabled:
+            return
+        now = time.time()
+        self._remember(key, value, now)
+        if self.path:
+            with self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now),
+                )
+                # Evict expired entries and the least recently used ones beyond the limit
+                if self.ttl is not None:
+                    db.execute(
+                        "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+                    )
+                db.execute(
+                    """DELETE FROM responses WHERE key NOT IN (
+                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?
+                    )""",
+                    (self.max_entries,),
+                )
@@ -0,0 +1,80 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class LLMExecutor:
+    """Dedicated, bounded thread pool for the blocking calls of the LLM SDK.
+
+    At most `max_in_flight` calls run at a time and callers wait for a free slot
+    before their timeout starts. A slot is only freed when the call really returns:
+    a call abandoned on timeout keeps its slot until the SDK gives up on it (pass the
+    same timeout in `request_options`), so abandoned calls can never pile up.
+    """
+
+    def __init__(self, max_in_flight: int = 4):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="llm"
+        )
+        self._loop = None
+        self._slots = None
+
+    @classmethod
+    def from_env(cls) -> "LLMExecutor":
+        """Build an executor from LLM_MAX_IN_FLIGHT"""
+        return cls(max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", 4)))
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives belong to one loop, and each asyncio.run starts a new one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._slots
+
+    async def start(self, func) -> asyncio.Future:
+        """Wait for a free slot and start `func` in the pool
+
+        Returns:
+            asyncio.Future: Resolves with the result of `func`, its slot is freed when it does
+        """
+        slots = self._semaphore()
+        await slots.acquire()
+        self.in_flight += 1
+
+        def release(_):
+            self.in_flight -= 1
+            slots.release()
+
+        future = asyncio.get_running_loop().run_in_executor(self._pool, func)
+        future.add_done_callback(release)
+        return future
+
+    async def run(self, func, timeout: float):
+        """Run `func` in the pool and wait at most `timeout` seconds for its result
+
+        Raises:
+            TimeoutError: If `func` did not return in time, it keeps its slot until it does
+        """
+        future = await self.start(func)
+        try:
+            # Shielded, so that a timeout does not free the slot of a still running call
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except TimeoutError:
+            logger.warning(
+                "Abandoned an LLM call after %.1fs, %d call(s) in flight",
+                timeout,
+                self.in_flight,
+            )
+            # Retrieve its outcome later, so it is not reported as never retrieved
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker threads, dropping the calls that did not start yet"""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,84 @@
+"""Streaming of LLM responses line by line.
+
+The blocking chunk iterator of `generate_content(..., stream=True)` is consumed in a
+worker thread and handed over to the event loop chunk by chunk, so the agent can act
+on a FUNCTION_CALL line while the rest of the response is still being generated.
+"""
+
+import asyncio
+import threading
+
+_DONE = object()
+
+
+class LineSplitter:
+    """Incremental parser turning streamed text chunks into complete, non-empty lines"""
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text: str) -> list[str]:
+        """Add a chunk and return the lines it completed"""
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        return [line.strip() for line in lines if line.strip()]
+
+    def flush(self) -> list[str]:
+        """Return the last line once the stream has ended"""
+        line, self._pending = self._pending.strip(), ""
+        return [line] if line else []
+
+
+def chunk_text(chunk) -> str:
+    """Text of a streamed chunk, without stripping the newlines between chunks"""
+    if not chunk.candidates:
+        return ""
+    return "".join(part.text for part in chunk.candidates[0].content.parts if part.text)
+
+
+async def stream_chunks(open_stream, timeout: float, executor=None):
+    """Yield the text chunks of a blocking stream as they arrive
+
+    Args:
+        open_stream (Callable): Starts the request and returns the chunk iterator, run in a worker thread
+        timeout (float): Seconds allowed for the whole response
+        executor (LLMExecutor, optional): Bounded pool running the worker, the loop's default executor when None
+
+    Raises:
+        TimeoutError: If the response is not complete after `timeout` seconds
+
+    Closing the generator early stops the worker at the next chunk and drops the rest of the
+    response, so the remaining tokens no longer hold up the caller.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    stopped = threading.Event()
+
+    def pump():
+        try:
+            for chunk in open_stream():
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(chunks.put_nowait, chunk_text(chunk))
+        except Exception as e:
+            loop.call_soon_threadsafe(chunks.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(chunks.put_nowait, _DONE)
+
+    if executor is not None:
+        worker = await executor.start(pump)
+    else:
+        worker = loop.run_in_executor(None, pump)
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            item = await asyncio.wait_for(chunks.get(), deadline - loop.time())
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        # The worker only notices at its next chunk, there is no need to wait for it
+        worker.add_done_callback(lambda future: future.exception())
@@ -0,0 +1,96 @@
+"""Leveled, non-blocking logging shared by the clients and the servers.
+
+Records are formatted lazily (`logger.debug("x: %s", x)` costs nothing above DEBUG)
+and handed to a QueueHandler, so the hot path never waits on a terminal write:
+a QueueListener thread formats them and writes them out. Colors are only added
+when the output is a terminal.
+
+LOG_LEVEL (DEBUG, INFO, WARNING, ...) sets the level, INFO by default.
+"""
+
+import os
+import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# Use colors to make the logs more readable
+COLORS = {
+    "black": "\033[30m",
+    "red": "\033[31m",
+    "green": "\033[32m",
+    "yellow": "\033[33m",
+    "blue": "\033[34m",
+    "magenta": "\033[35m",
+    "cyan": "\033[36m",
+    "white": "\033[37m",
+    "reset": "\033[0m",
+    "bold": "\033[1m",
+    "underline": "\033[4m",
+    "italic": "\033[3m",
+}
+
+LEVEL_COLORS = {
+    logging.DEBUG: COLORS["yellow"],
+    logging.WARNING: COLORS["magenta"],
+    logging.ERROR: COLORS["red"],
+    logging.CRITICAL: COLORS["red"] + COLORS["bold"],
+}
+
+_listener = None
+
+
+class ColorFormatter(logging.Formatter):
+    """Colors a record by its `color` extra (e.g. "green bold") or else by its level"""
+
+    def __init__(self, fmt=None, use_colors: bool = True):
+        super().__init__(fmt)
+        self.use_colors = use_colors
+
+    def format(self, record):
+        message = super().format(record)
+        if not self.use_colors:
+            return message
+        color = getattr(record, "color", None)
+        if color:
+            prefix = "".join(COLORS[name] for name in color.split())
+        else:
+            prefix = LEVEL_COLORS.get(record.levelno)
+        if not prefix:
+            return message
+        return f"{prefix}{message}{COLORS['reset']}"
+
+
+def setup_logging(level=None, stream=None):
+    """Route the records of every logger through a queue to `stream` (stdout by default)
+
+    Args:
+        level (str | int, optional): Root level, LOG_LEVEL or INFO when not given
+        stream (file, optional): Where the records are written, servers on stdio must use stderr
+
+    Returns:
+        logging.handlers.QueueListener: The thread writing the records, stopped at exit
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream = stream or sys.stdout
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(
+        ColorFormatter(
+            "%(asctime)s %(levelname)s %(name)s: %(message)s",
+            use_colors=stream.isatty(),
+        )
+    )
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    # Flush what is left in the queue before the interpreter exits
+    atexit.register(_listener.stop)
+    return _listener
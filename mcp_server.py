@@ -1,19 +1,39 @@
 # basic import
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp.prompts import base
-from mcp.types import TextContent
+from mcp.types import ImageContent, TextContent, ToolAnnotations
+import os
 import sys
-from use_paint_preview_with_mac import *
+import json
+import base64
+import asyncio
+import logging
+from functools import lru_cache
+from paint_renderer import render_text_png
+from tool_memo import pure_tool, memo_stats
+from tool_profiler import profiled_tool, tool_metrics
+from log_config import setup_logging
 
 
 # instantiate an MCP server client
 mcp = FastMCP("Calculator")
+logger = logging.getLogger("mcp_server")
+
+# add_text_in_paint renders the image in memory by default. PAINT_BACKEND=preview drives
+# the Preview app of macOS instead (needs a display and pyautogui)
+paint_backend = os.getenv("PAINT_BACKEND", "headless").lower()
 
 # DEFINE TOOLS
 
+# Tools without side effects, which clients may call speculatively (e.g. while still
+# streaming the rest of the LLM response). Tools that draw or send emails must not use it
+READ_ONLY = ToolAnnotations(readOnlyHint=True)
+
 
 # addition tool
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+@pure_tool()
 def add(a: int, b: int) -> int:
     """Given two numbers, return the sum of the two numbers
 
@@ -24,11 +44,13 @@ def add(a: int, b: int) -> int:
     Returns:
         int: The sum of the given two numbers
     """
-    print("CALLED: add(a: int, b: int) -> int:")
+    logger.debug("CALLED: add(a: int, b: int) -> int:")
     return int(a + b)
 
 
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+@pure_tool()
 def can_I_listify_a_number(a: int) -> str:
     """Given a number, check if it can be further listified
 
@@ -38,7 +60,7 @@ def can_I_listify_a_number(a: int) -> str:
     Returns:
         str: A message indicating if the number can be listified or not and the reason why
     """
-    print("CALLED: can_listify_a_number(a: int) -> bool:")
+    logger.debug("CALLED: can_listify_a_number(a: int) -> bool:")
     if a > 9:
         return f"{a} can be converted into a list of digits since there are more than 1 digits in the number"
     else:
@@ -46,7 +68,9 @@ def can_I_listify_a_number(a: int) -> str:
 
 
 # tool to convert a number into a list of it's digits
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+@pure_tool()
 def listify_number(a: int) -> list[int]:
     """Given a number, convert it to a list of its digits
 
@@ -56,17 +80,14 @@ def listify_number(a: int) -> list[int]:
     Returns:
         list[int]: A list of the digits of the given number.
     """
-    print("CALLED: listify_number(a: int) -> list[int]:")
-    digits = []
-    while a > 0:
-        digits.append(a % 10)
-        a = a // 10
-    digits = digits[::-1]
-    return digits
+    logger.debug("CALLED: listify_number(a: int) -> list[int]:")
+    return _digits(a)
 
 
 # tool to add numbers in a list
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+@pure_tool()
 def summify_list(a: list) -> int:
     """Given a list of natural numbers, sum the numbers and return the result
 
@@ -76,15 +97,130 @@ def summify_list(a: list) -> int:
     Returns:
         int: The sum of the given list of numbers
     """
-    print("CALLED: summify_list(a:list[int]) -> int")
-    sum_of_elements = a[0]
-    for i in range(1, len(a)):
-        sum_of_elements = add(sum_of_elements, a[i])
-    return sum_of_elements
+    logger.debug("CALLED: summify_list(a:list[int]) -> int")
+    return sum(a)
+
+
+def _decimal(a: int | str) -> str:
+    """Decimal string of a natural number given as an int or as a string of digits
+
+    Strings are never converted to int, so they can have any number of digits
+    """
+    # A leading "-" is not stripped: negative numbers are rejected, not silently made positive
+    text = str(a).strip().removeprefix("+")
+    if not (text.isascii() and text.isdigit()):
+        raise ValueError(f"Expected a natural number, got {a!r}")
+    return text.lstrip("0") or "0"
+
+
+def _digits(a: int | str) -> list[int]:
+    """Digits of a natural number, extracted from its decimal string in one pass"""
+    return [int(digit) for digit in _decimal(a)]
+
+
+def _digit_sum(a: int | str) -> int:
+    """Sum of the digits of a natural number, counting each digit in C instead of looping in python"""
+    text = _decimal(a)
+    return sum(int(digit) * text.count(digit) for digit in "123456789")
+
+
+def _digital_root(a: int | str) -> int:
+    """Result of summing the digits of a natural number until a single digit is left"""
+    digit_sum = _digit_sum(a)
+    return 0 if digit_sum == 0 else 1 + (digit_sum - 1) % 9
+
+
+# batched variants of the digit tools, to handle many (or very large) numbers in one call.
+# The numbers are decimal strings: JSON-RPC rejects integers of more than 4300 digits
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+def listify_numbers(a: list[str]) -> str:
+    """Given a list of numbers, convert each of them to the list of its digits
+
+    Args:
+        a (list[str]): A list of natural numbers, as decimal strings of any length
+
+    Returns:
+        str: The list of the digits of each given number, in the same order, as JSON
+    """
+    logger.debug("CALLED: listify_numbers(a: list[str]) -> str:")
+    # A returned list would become one content item per digit, losing which number each came from
+    return json.dumps([_digits(number) for number in a])
+
+
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+def digit_sum_many(a: list[str]) -> list[int]:
+    """Given a list of numbers, return the sum of the digits of each of them
+
+    Args:
+        a (list[str]): A list of natural numbers, as decimal strings of any length
+
+    Returns:
+        list[int]: The sum of the digits of each given number, in the same order
+    """
+    logger.debug("CALLED: digit_sum_many(a: list[str]) -> list[int]:")
+    return [_digit_sum(number) for number in a]
+
+
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+def digital_root_many(a: list[str]) -> list[int]:
+    """Given a list of numbers, return the digital root of each of them, i.e. the single digit obtained by summing its digits repeatedly
+
+    Args:
+        a (list[str]): A list of natural numbers, as decimal strings of any length
+
+    Returns:
+        list[int]: The digital root of each given number, in the same order
+    """
+    logger.debug("CALLED: digital_root_many(a: list[str]) -> list[int]:")
+    return [_digital_root(number) for number in a]
+
+
+@lru_cache(maxsize=4096)
+def _digit_sum_trajectory(a: int) -> tuple[int, ...]:
+    """A, the sum of its digits, the sum of those digits, ... down to a single digit"""
+    if a < 10:
+        return (a,)
+    # The tail is memoized too, so numbers sharing a digit sum share the work
+    return (a,) + _digit_sum_trajectory(_digit_sum(a))
+
+
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+@pure_tool()
+def can_reach_by_digit_sums(a: int, b: int) -> str:
+    """Given two natural numbers A and B, check in a single step if A can be made equal to B by repeatedly replacing A with the sum of its digits. Returns the whole trajectory of A so no other tool is needed to answer this question.
+
+    Args:
+        a (int): The starting number A
+        b (int): The target number B
+
+    Returns:
+        str: The trajectory of A (A, sum of digits of A, ...) and whether B is on it
+    """
+    logger.debug("CALLED: can_reach_by_digit_sums(a: int, b: int) -> str:")
+    a, b = abs(int(a)), abs(int(b))
+    trajectory = _digit_sum_trajectory(a)
+    steps = " -> ".join(str(number) for number in trajectory)
+    # Summing digits keeps the value modulo 9, so B must share A's digital root
+    if b <= a and _digital_root(b) == _digital_root(a) and b in trajectory:
+        operations = trajectory.index(b)
+        return (
+            f"YES, {a} can be made equal to {b} by summing its digits recursively "
+            f"({operations} operation(s)). Trajectory: {steps}"
+        )
+    return (
+        f"NO, {a} can never be made equal to {b} by summing its digits recursively. "
+        f"Trajectory: {steps}"
+    )
 
 
 # subtraction tool
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+@pure_tool()
 def subtract(a: int, b: int) -> int:
     """Given two numbers, return the difference of the two numbers (second deducted from the first)
 
@@ -95,12 +231,14 @@ def subtract(a: int, b: int) -> int:
     Returns:
         int: Subtract the second number from the first and return the result
     """
-    print("CALLED: subtract(a: int, b: int) -> int:")
+    logger.debug("CALLED: subtract(a: int, b: int) -> int:")
     return int(a - b)
 
 
 # check integer equality
-@mcp.tool()
+@mcp.tool(annotations=READ_ONLY)
+@profiled_tool()
+@pure_tool()
 def check_integer_equality(a: int, b: int) -> str:
     """Given two numbers, compare if the two numbers are equal or not
 
@@ -111,7 +249,7 @@ def check_integer_equality(a: int, b: int) -> str:
     Returns:
         str: A message indicating if the two numbers are equal or not
     """
-    print("CALLED: check_integer_equality(a: int, b: int) -> bool:")
+    logger.debug("CALLED: check_integer_equality(a: int, b: int) -> bool:")
     if int(a) == int(b):
         return f"{int(a)} and {int(b)} are exactly the same"
     else:
@@ -119,34 +257,47 @@ def check_integer_equality(a: int, b: int) -> str:
 
 
 @mcp.tool()
-async def add_text_in_paint(text: str) -> dict:
-    """Given a text, take that text, create a new image, open it in mac preview, create a rectangle on the image and add the text to the rectangle
+@profiled_tool()
+async def add_text_in_paint(text: str) -> list[TextContent | ImageContent]:
+    """Given a text, take that text, create a new image, create a rectangle on the image and add the text to the rectangle
 
     Args:
         text (str): Text to add to the image
 
     Returns:
-        dict: A message indicating if the text was added succesully or not and a helpful error message if it wasn't added successfully
+        list: A message indicating if the text was added succesully or not and a helpful error message if it wasn't added successfully, followed by the PNG image
     """
+    logger.debug("CALLED: add_text_in_paint(text: str) -> list:")
     try:
-        open_paint_with_text_mac(text)
-        return {
-            "content": [
+        if paint_backend == "preview":
+            # GUI automation needs a display, so it is only imported when asked for
+            from use_paint_preview_with_mac import open_paint_with_text_mac
+
+            # It blocks for several seconds, keep the event loop serving other requests
+            await asyncio.to_thread(open_paint_with_text_mac, text)
+            return [
                 TextContent(
                     type="text",
                     text=f"Text:'{text}' added successfully to the paint application",
                 )
             ]
-        }
+        png = render_text_png(text)
+        return [
+            TextContent(
+                type="text",
+                text=f"Text:'{text}' added successfully to the paint application",
+            ),
+            ImageContent(
+                type="image", data=base64.b64encode(png).decode(), mimeType="image/png"
+            ),
+        ]
     except Exception as e:
-        return {
-            "content": [
-                TextContent(
-                    type="text",
-                    text=f"Could not add the text to paint application. Error: {str(e)}.",
-                )
-            ]
-        }
+        return [
+            TextContent(
+                type="text",
+                text=f"Could not add the text to paint application. Error: {str(e)}.",
+            )
+        ]
 
 
 # DEFINE RESOURCES
@@ -156,15 +307,31 @@ async def add_text_in_paint(text: str) -> dict:
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
     """Get a personalized greeting"""
-    print("CALLED: get_greeting(name: str) -> str:")
+    logger.debug("CALLED: get_greeting(name: str) -> str:")
     return f"Hello, {name}!"
 
 
+# Hit/miss counters of the memoized pure tools
+@mcp.resource("memo://stats")
+def get_memo_stats() -> str:
+    """Get the hit/miss counters and cache sizes of the memoized pure tools"""
+    logger.debug("CALLED: get_memo_stats() -> str:")
+    return json.dumps(memo_stats())
+
+
+# Call counts, latencies, argument sizes and exceptions of every tool
+@mcp.resource("metrics://tools")
+def get_tool_metrics() -> str:
+    """Get the execution profile of every tool since the server started"""
+    logger.debug("CALLED: get_tool_metrics() -> str:")
+    return json.dumps(tool_metrics())
+
+
 # DEFINE AVAILABLE PROMPTS
 @mcp.prompt()
 def review_code(code: str) -> str:
     return f"Please review this code:\n\n{code}"
-    print("CALLED: review_code(code: str) -> str:")
+    logger.debug("CALLED: review_code(code: str) -> str:")
 
 
 @mcp.prompt()
@@ -178,8 +345,15 @@ def debug_error(error: str) -> list[base.Message]:
 
 if __name__ == "__main__":
     # Check if running with mcp dev command
-    print("STARTING")
+    # stdout carries the MCP messages over stdio, so the logs go to stderr
+    setup_logging(stream=sys.stderr)
+    logger.info("STARTING")
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run()  # Run without transport for dev server
+    elif len(sys.argv) > 1 and sys.argv[1] in ("sse", "streamable-http"):
+        # Long-lived server shared by many client runs, see MCP_SERVER_URL in the clients
+        mcp.settings.host = os.getenv("MCP_HOST", mcp.settings.host)
+        mcp.settings.port = int(os.getenv("MCP_PORT", mcp.settings.port))
+        mcp.run(transport=sys.argv[1])
     else:
         mcp.run(transport="stdio")  # Run with stdio for direct execution
@@ -0,0 +1,113 @@
+"""Latency histograms of the agent loop, exported as Prometheus text or JSON.
+
+Every iteration records where its seconds went (rate limit wait, LLM call, response
+parsing, argument coercion and each tool call). The histograms are cumulative over
+the process and written to AGENT_METRICS_PATH at the end of each run: `.json` files get
+JSON, any other name the Prometheus text exposition format (e.g. for the textfile
+collector of node_exporter).
+"""
+
+import os
+import json
+import bisect
+import threading
+
+# Upper bounds in seconds, from parsing a response line to a slow LLM response
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+HELP = {
+    "agent_iteration_seconds": "Wall time of an iteration of the agent loop",
+    "agent_rate_limit_wait_seconds": "Time spent waiting for the LLM rate limit budget",
+    "agent_llm_call_seconds": "Time spent in the LLM call itself",
+    "agent_parse_seconds": "Time spent reading the FUNCTION_CALL lines of a response",
+    "agent_coercion_seconds": "Time spent parsing the calls and coercing their arguments",
+    "agent_tool_call_seconds": "Duration of a session.call_tool round trip",
+}
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket upper bounds"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """(upper bound, observations at or below it) pairs, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return pairs
+
+
+class MetricsRegistry:
+    """Histograms by metric name and label values"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+        documented = set()
+        for (name, labels), histogram in items:
+            if name not in documented:
+                documented.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            label_str = ",".join(f'{key}="{value}"' for key, value in labels)
+            for bound, count in histogram.cumulative():
+                bucket_labels = ",".join(filter(None, [label_str, f'le="{bound}"']))
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {count}")
+            suffix = f"{{{label_str}}}" if label_str else ""
+            lines.append(f"{name}_sum{suffix} {histogram.sum}")
+            lines.append(f"{name}_count{suffix} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> list[dict]:
+        with self._lock:
+            items = sorted(self._histograms.items())
+        return [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "buckets": dict(histogram.cumulative()),
+            }
+            for (name, labels), histogram in items
+        ]
+
+    def export(self, path: str):
+        """Write the metrics to `path` atomically, as JSON if it ends with .json"""
+        if path.endswith(".json"):
+            content = json.dumps(self.to_json(), indent=2)
+        else:
+            content = self.to_prometheus()
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(content)
+        os.replace(temporary, path)
@@ -0,0 +1,50 @@
+import io
+from PIL import Image, ImageDraw, ImageFont
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed size bitmap font
+        return ImageFont.load_default()
+
+
+def render_text_png(
+    text: str, width: int = 800, height: int = 600, font_size: int = 28
+) -> bytes:
+    """Draw a rectangle with the text centered in it on a white canvas, in memory
+
+    Headless replacement for driving Preview or Tk: no display, no window and no sleeps.
+
+    Args:
+        text (str): Text to write in the rectangle
+        width (int): Width of the image in pixels
+        height (int): Height of the image in pixels
+        font_size (int): Size of the text
+
+    Returns:
+        bytes: The image, PNG encoded
+    """
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    font = _font(font_size)
+
+    # Same layout as the Tk version, grown to fit long texts
+    left, top, right, bottom = draw.multiline_textbbox((0, 0), text, font=font)
+    box_width = min(width - 20, max(width // 2, right - left + 40))
+    box_height = min(height - 20, max(height // 3, bottom - top + 40))
+    rect = (
+        (width - box_width) // 2,
+        (height - box_height) // 2,
+        (width + box_width) // 2,
+        (height + box_height) // 2,
+    )
+    draw.rectangle(rect, fill="lightblue", outline="black", width=2)
+    draw.multiline_text(
+        (width // 2, height // 2), text, font=font, fill="black", anchor="mm", align="center"
+    )
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
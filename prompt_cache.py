@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import threading
+
+
+class PromptCache:
+    """Rendered prompt blocks keyed by a hash of the tool list.
+
+    The tools only change when the server does, so the tools description and the
+    system prompt built from it are rendered once and reused by every run. With a
+    `directory` they are also written to disk and reused by the next processes.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        self._memory = {}
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "PromptCache":
+        """Build a cache from PROMPT_CACHE_DIR (in memory only when unset)"""
+        return cls(directory=os.getenv("PROMPT_CACHE_DIR") or None)
+
+    @staticmethod
+    def fingerprint(tools) -> str:
+        """Hash of the name, description and input schema of every tool"""
+        payload = json.dumps(
+            [
+                {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "inputSchema": tool.inputSchema,
+                }
+                for tool in tools
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def get(self, key: str):
+        """Return the cached text for `key`, or None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+        if self.directory and os.path.exists(self._path(key)):
+            with open(self._path(key), encoding="utf-8") as f:
+                text = f.read()
+            with self._lock:
+                self._memory[key] = text
+            return text
+        return None
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._memory[key] = text
+        if self.directory:
+            # Write then rename, so a concurrent process never reads half a prompt
+            temporary = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(temporary, self._path(key))
+
+    def get_or_render(self, key: str, render) -> str:
+        """Return the cached text for `key`, rendering and storing it on a miss"""
+        text = self.get(key)
+        if text is None:
+            text = render()
+            self.put(key, text)
+        return text
@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token-bucket rate limiter for LLM calls, budgeted in requests and tokens per minute.
+
+    Callers only wait when the budget is actually used up. When the API reports a
+    quota error (HTTP 429 / ResourceExhausted), the limiter backs off exponentially
+    and every waiting caller honours that pause.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 15,
+        tokens_per_minute: float = 1_000_000,
+        base_backoff: float = 2.0,
+        max_backoff: float = 60.0,
+    ):
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        # Both buckets start full so the first calls of a run never wait
+        self._request_budget = self.requests_per_minute
+        self._token_budget = self.tokens_per_minute
+        self._last_refill = time.monotonic()
+        self._backoff_until = 0.0
+        self._consecutive_failures = 0
+        self._loop = None
+        self._lock = None
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Build a limiter from GEMINI_RPM / GEMINI_TPM, falling back to the free tier limits"""
+        return cls(
+            requests_per_minute=float(os.getenv("GEMINI_RPM", 15)),
+            tokens_per_minute=float(os.getenv("GEMINI_TPM", 1_000_000)),
+        )
+
+    @staticmethod
+    def estimate_tokens(prompt) -> int:
+        """Cheap local token estimate (~4 characters per token)"""
+        return max(1, len(str(prompt)) // 4)
+
+    def _loop_lock(self) -> asyncio.Lock:
+        # The lock belongs to the loop that created it, and each asyncio.run starts a new one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_budget = min(
+            self.requests_per_minute,
+            self._request_budget + elapsed * self.requests_per_minute / 60.0,
+        )
+        self._token_budget = min(
+            self.tokens_per_minute,
+            self._token_budget + elapsed * self.tokens_per_minute / 60.0,
+        )
+
+    def _wait_time(self, tokens: float) -> float:
+        """Seconds until one request costing `tokens` fits in the budget (0 if it fits now)"""
+        waits = [self._backoff_until - time.monotonic()]
+        if self._request_budget < 1:
+            waits.append((1 - self._request_budget) * 60.0 / self.requests_per_minute)
+        if self._token_budget < tokens:
+            waits.append((tokens - self._token_budget) * 60.0 / self.tokens_per_minute)
+        return max(waits)
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait until there is budget for one request of `tokens` tokens, then consume it
+
+        Args:
+            tokens (int): Estimated number of tokens the request will use
+
+        Returns:
+            float: Number of seconds spent waiting
+        """
+        # A single request can never cost more than a full bucket
+        tokens = min(float(tokens), self.tokens_per_minute)
+        waited = 0.0
+        async with self._loop_lock():
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    self._request_budget -= 1
+                    self._token_budget -= tokens
+                    return waited
+                logger.info("Rate limit budget exhausted, waiting %.2fs...", wait)
+                await asyncio.sleep(wait)
+                waited += wait
+
+    def report_success(self):
+        """Reset the backoff after a successful call"""
+        self._consecutive_failures = 0
+
+    def report_rate_limited(self, retry_after: float = None) -> float:
+        """Register a quota error and schedule an exponential backoff
+
+        Args:
+            retry_after (float, optional): Delay suggested by the API, if any
+
+        Returns:
+            float: Number of seconds all callers will pause for
+        """
+        self._consecutive_failures += 1
+        delay = retry_after
+        if delay is None:
+            delay = min(
+                self.max_backoff,
+                self.base_backoff * (2 ** (self._consecutive_failures - 1)),
+            )
+        self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+        # The server says we're out of quota, so trust it over our local accounting
+        self._request_budget = min(self._request_budget, 0)
+        return delay
+
+    @staticmethod
+    def is_rate_limit_error(error: Exception) -> bool:
+        """Check whether an exception raised by the Gemini SDK is a 429 / quota error"""
+        if getattr(error, "code", None) == 429:
+            return True
+        message = f"{type(error).__name__} {error}".lower()
+        return any(
+            marker in message
+            for marker in ("429", "resourceexhausted", "resource exhausted", "quota")
+        )
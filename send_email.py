@@ -1,24 +1,193 @@
 import os
+import time
+import socket
+import logging
 import smtplib
+import threading
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 # Load all the secrets for sending the email
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-# Function to send an email
-def send_email(recipient_email: str, subject: str, query_answer: str) -> bool:
-    """Send email using SMTP."""
-    try:
-        # Create message
-        msg = MIMEMultipart()
-        msg["From"] = os.getenv("SENDER_EMAIL")
-        msg["To"] = recipient_email
-        msg["Subject"] = subject
-
-        # Create email body
-        body = f"""
+# Errors of a connection the server dropped under us, worth one retry on a fresh connection.
+# Not OSError: every SMTPException is one, and e.g. an authentication error must not be retried
+CONNECTION_DROPPED = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+class SMTPConnectionPool:
+    """Pool of reusable, authenticated SMTP connections.
+
+    Connections are kept open between sends, checked with NOOP when they have been
+    idle for longer than `keepalive_interval` seconds and transparently re-opened
+    when the server dropped them.
+    """
+
+    def __init__(
+        self,
+        host: str = None,
+        port: int = None,
+        username: str = None,
+        password: str = None,
+        use_tls: bool = True,
+        max_size: int = 2,
+        keepalive_interval: float = 60,
+        timeout: float = 30,
+    ):
+        self.host = host
+        self.port = int(port) if port else 587
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_size = max_size
+        self.keepalive_interval = keepalive_interval
+        self.timeout = timeout
+        # Idle connections along with the time they were last used
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SMTPConnectionPool":
+        """Build a pool from the SMTP_* and SENDER_* variables of the .env file"""
+        return cls(
+            host=os.getenv("SMTP_SERVER"),
+            port=os.getenv("SMTP_PORT"),
+            username=os.getenv("SENDER_EMAIL"),
+            password=os.getenv("SENDER_PASSWORD"),
+            use_tls=os.getenv("SMTP_USE_TLS", "1").lower() in ("1", "true", "yes"),
+            max_size=int(os.getenv("SMTP_POOL_SIZE", 2)),
+        )
+
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new SMTP session"""
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except BaseException:
+            server.close()
+            raise
+        return server
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _discard(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            # Only pay for a NOOP round trip when the connection sat idle for a while
+            if time.monotonic() - last_used < self.keepalive_interval:
+                return server
+            if self._is_alive(server):
+                return server
+            self._discard(server)
+        return self._connect()
+
+    def _release(self, server: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((server, time.monotonic()))
+                return
+        self._discard(server)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool, it is returned to the pool unless it raised"""
+        server = self._acquire()
+        try:
+            yield server
+        except BaseException:
+            # The session may be in any state, don't hand it to the next sender
+            server.close()
+            raise
+        else:
+            self._release(server)
+
+    def send_message(self, msg):
+        """Send one message, reconnecting once if the pooled connection was dropped"""
+        if not self.send_messages([msg])[0]:
+            raise smtplib.SMTPException(f"Message to {msg['To']} was not sent")
+
+    def send_messages(self, messages: list) -> list[bool]:
+        """Send many messages over a single SMTP session
+
+        Args:
+            messages (list): The email.message.Message objects to send
+
+        Returns:
+            list[bool]: Whether each message was accepted by the server, in order
+        """
+        results = []
+        pending = list(messages)
+        reconnected = False
+        while pending:
+            try:
+                with self.connection() as server:
+                    while pending:
+                        try:
+                            server.send_message(pending[0])
+                            results.append(True)
+                        except (
+                            smtplib.SMTPRecipientsRefused,
+                            smtplib.SMTPSenderRefused,
+                            smtplib.SMTPDataError,
+                        ) as e:
+                            logger.error("Error sending email: %s", e)
+                            results.append(False)
+                        pending.pop(0)
+            except CONNECTION_DROPPED as e:
+                # The server closed an idle connection under us, retry once on a fresh one
+                if not reconnected:
+                    reconnected = True
+                    continue
+                logger.error("Error sending email: %s", e)
+                break
+            except (smtplib.SMTPException, OSError) as e:
+                # e.g. the credentials were rejected, a new connection would fail the same way
+                logger.error("Error sending email: %s", e)
+                break
+        return results + [False] * len(pending)
+
+    def close(self):
+        """Close all the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+
+
+# Connections are shared by every email sent from this process
+smtp_pool = SMTPConnectionPool.from_env()
+
+
+def build_message(recipient_email: str, subject: str, query_answer: str) -> MIMEMultipart:
+    """Create the email answering a query."""
+    msg = MIMEMultipart()
+    msg["From"] = os.getenv("SENDER_EMAIL")
+    msg["To"] = recipient_email
+    msg["Subject"] = subject
+
+    # Create email body
+    body = f"""
         Here's the answer to your query:
 
         {query_answer}
@@ -27,17 +196,26 @@ def send_email(recipient_email: str, subject: str, query_answer: str) -> bool:
         Vinayak Nayak.
         """
 
-        msg.attach(MIMEText(body, "plain"))
+    msg.attach(MIMEText(body, "plain"))
+    return msg
 
-        # Create SMTP session
-        server = smtplib.SMTP(os.getenv("SMTP_SERVER"), os.getenv("SMTP_PORT"))
-        server.starttls()
-        server.login(os.getenv("SENDER_EMAIL"), os.getenv("SENDER_PASSWORD"))
 
-        # Send email
-        server.send_message(msg)
-        server.quit()
+# Function to send an email
+def send_email(recipient_email: str, subject: str, query_answer: str) -> bool:
+    """Send email using SMTP."""
+    try:
+        smtp_pool.send_message(build_message(recipient_email, subject, query_answer))
         return True
     except Exception as e:
-        print(f"Error sending email: {str(e)}")
+        logger.error("Error sending email: %s", e)
         return False
+
+
+def send_emails(emails: list[dict]) -> list[bool]:
+    """Send many emails over one SMTP session.
+
+    Each email is a dict with the `recipient_email`, `subject` and `query_answer`
+    arguments of `send_email`.
+    """
+    messages = [build_message(**email) for email in emails]
+    return smtp_pool.send_messages(messages)
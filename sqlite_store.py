@@ -0,0 +1,29 @@
+import sqlite3
+from contextlib import contextmanager
+
+
+@contextmanager
+def connect(path: str, timeout: float = 30, wal: bool = False, row_factory=None):
+    """Open a connection to a SQLite file, commit on success and always close it
+
+    Shared by the on-disk stores of the project (email queue, LLM response cache).
+
+    Args:
+        path (str): Path of the database file
+        timeout (float): Seconds to wait for a lock held by another connection or process
+        wal (bool): Switch the file to write-ahead logging, so readers don't block the writer
+        row_factory: Row factory of the connection, e.g. sqlite3.Row to access columns by name
+
+    Yields:
+        sqlite3.Connection: The open connection
+    """
+    db = sqlite3.connect(path, timeout=timeout)
+    try:
+        if wal:
+            db.execute("PRAGMA journal_mode=WAL")
+        if row_factory is not None:
+            db.row_factory = row_factory
+        with db:
+            yield db
+    finally:
+        db.close()
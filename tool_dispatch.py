@@ -0,0 +1,189 @@
+"""Dispatch table mapping every MCP tool to precompiled argument coercers.
+
+The table is built once after `session.list_tools()`. Converting the arguments of
+a call is then a dict lookup plus a call to functions prepared ahead of time,
+instead of walking `tool.inputSchema` on every iteration.
+"""
+
+import ast
+import json
+
+TRUE_STRINGS = {"true", "yes", "y", "1"}
+FALSE_STRINGS = {"false", "no", "n", "0"}
+
+
+def _parse_literal(value: str, parse_int=int):
+    """Parse a JSON or python literal like `[1, [2.5, 3]]` or `{'a': 1}`
+
+    `parse_int=str` keeps the integers as their decimal text, whatever their length
+    """
+    try:
+        return json.loads(value, parse_int=parse_int)
+    except ValueError:
+        return ast.literal_eval(value)
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f"Expected an integer, got {value}")
+        return int(value)
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            return int(value)
+        except ValueError:
+            return _to_int(float(value))
+    return int(value)
+
+
+def _to_float(value):
+    if isinstance(value, str):
+        value = value.strip()
+    return float(value)
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in TRUE_STRINGS:
+        return True
+    if text in FALSE_STRINGS:
+        return False
+    raise ValueError(f"Expected a boolean, got {value!r}")
+
+
+def _to_str(value):
+    if isinstance(value, str):
+        return value
+    return json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+
+
+def _to_untyped(value):
+    """Values without a schema type: numbers in strings become numbers, the rest is kept
+
+    Whole floats become ints, like in _to_int: Gemini sends every JSON number as a float
+    """
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return _to_untyped(float(text))
+    except ValueError:
+        return text.strip("'\"")
+
+
+def _compile_array(schema: dict):
+    item_schema = schema.get("items") or {}
+    item_coercer = compile_coercer(item_schema)
+    # Numbers meant as strings (e.g. 10k digits ones) never go through int()
+    parse_int = str if item_schema.get("type") == "string" else int
+
+    def coerce(value):
+        if isinstance(value, str):
+            text = value.strip()
+            try:
+                value = _parse_literal(text, parse_int)
+            except (ValueError, SyntaxError):
+                # Fall back to a bare comma separated list like `1, 2, 3`
+                text = text.strip("[]")
+                value = [item for item in text.split(",") if item.strip()]
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+        return [item_coercer(item) for item in value]
+
+    return coerce
+
+
+def _compile_object(schema: dict):
+    property_coercers = {
+        name: compile_coercer(property_schema)
+        for name, property_schema in schema.get("properties", {}).items()
+    }
+
+    def coerce(value):
+        if isinstance(value, str):
+            value = _parse_literal(value.strip())
+        if not isinstance(value, dict):
+            raise ValueError(f"Expected an object, got {value!r}")
+        return {
+            key: property_coercers.get(key, _to_untyped)(item)
+            for key, item in value.items()
+        }
+
+    return coerce
+
+
+def compile_coercer(schema: dict):
+    """Build the function converting a raw argument (text or JSON value) to its schema type
+
+    Args:
+        schema (dict): JSON schema of the argument, as found in `tool.inputSchema`
+
+    Returns:
+        Callable: Function taking the raw value and returning the converted value
+    """
+    param_type = schema.get("type")
+    if param_type == "integer":
+        return _to_int
+    if param_type == "number":
+        return _to_float
+    if param_type == "boolean":
+        return _to_bool
+    if param_type == "string":
+        return _to_str
+    if param_type == "array":
+        return _compile_array(schema)
+    if param_type == "object":
+        return _compile_object(schema)
+    return _to_untyped
+
+
+class ToolSpec:
+    """A tool of the MCP server together with the coercers of its parameters"""
+
+    def __init__(self, tool):
+        self.tool = tool
+        self.name = tool.name
+        # Declared free of side effects by the server, so it is safe to call before the
+        # rest of the response is known (see the streaming mode of the agent)
+        annotations = getattr(tool, "annotations", None)
+        self.read_only = bool(annotations and annotations.readOnlyHint)
+        properties = tool.inputSchema.get("properties", {})
+        self.param_names = list(properties)
+        self.coercers = {
+            name: compile_coercer(param_schema)
+            for name, param_schema in properties.items()
+        }
+
+    def coerce_params(self, params: list) -> dict:
+        """Convert positional parameters (from `FUNCTION_CALL: name|p1|p2`) into typed arguments"""
+        if len(params) < len(self.param_names):
+            raise ValueError(f"Not enough parameters provided for {self.name}")
+        return {
+            name: self.coercers[name](value)
+            for name, value in zip(self.param_names, params)
+        }
+
+    def coerce_arguments(self, arguments: dict) -> dict:
+        """Convert named arguments (from native function calling) into typed arguments"""
+        return {
+            name: self.coercers.get(name, _to_untyped)(value)
+            for name, value in arguments.items()
+        }
+
+
+def build_dispatch_table(tools) -> dict[str, ToolSpec]:
+    """Map every tool name to its precompiled ToolSpec"""
+    return {tool.name: ToolSpec(tool) for tool in tools}
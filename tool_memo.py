@@ -0,0 +1,90 @@
+"""Memoization of pure MCP tools.
+
+Stack `@pure_tool()` under `@mcp.tool()` on tools whose result only depends on their
+arguments. Tools with side effects (sending an email, drawing in paint) must never
+be decorated.
+"""
+
+import json
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+# Every memoized tool registers its cache here, so the stats can be exposed as a resource
+_caches = {}
+
+
+class ToolCache:
+    """Bounded LRU of the results of one tool, with hit/miss counters"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return True, self._results[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._results),
+                "maxsize": self.maxsize,
+            }
+
+
+def _make_key(args, kwargs) -> str:
+    # Lists are not hashable, so key on the canonical JSON of the arguments
+    return json.dumps([args, kwargs], sort_keys=True, default=repr)
+
+
+def pure_tool(maxsize: int = 1024):
+    """Mark a tool as pure and memoize its results in a bounded LRU
+
+    Args:
+        maxsize (int): Maximum number of results kept for this tool
+
+    Returns:
+        Callable: Decorator keeping the signature of the tool, so FastMCP still sees its arguments
+    """
+
+    def decorator(func):
+        cache = ToolCache(maxsize)
+        _caches[func.__name__] = cache
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _make_key(args, kwargs)
+            found, result = cache.get(key)
+            if found:
+                return result
+            result = func(*args, **kwargs)
+            cache.put(key, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def memo_stats() -> dict:
+    """Hit/miss counters and sizes of the caches of all the pure tools"""
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,198 @@
+"""Execution profile of the MCP tools.
+
+Stack `@profiled_tool()` right under `@mcp.tool()` (above `@pure_tool()`, so cache hits
+are counted too) to record per tool the number of calls, the total and maximum latency,
+the size of the arguments and the exceptions raised.
+
+TOOL_PROFILE=cprofile,tracemalloc additionally samples one call in TOOL_PROFILE_EVERY
+(10 by default) of the synchronous tools with cProfile (hottest functions) and/or
+tracemalloc (peak memory).
+"""
+
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import inspect
+import threading
+import tracemalloc
+from functools import wraps
+
+# ToolProfile by tool name, read by tool_metrics() for the metrics://tools resource
+_profiles = {}
+
+_profile_modes = {
+    mode.strip().lower()
+    for mode in os.getenv("TOOL_PROFILE", "").split(",")
+    if mode.strip()
+}
+_profile_every = max(1, int(os.getenv("TOOL_PROFILE_EVERY", 10)))
+
+# Only one cProfile profiler can be active at a time
+_cprofile_lock = threading.Lock()
+
+if "tracemalloc" in _profile_modes and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+class ToolProfile:
+    """Counters of one tool, plus its sampled cProfile stats"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_arg_bytes = 0
+        self.max_arg_bytes = 0
+        self.exceptions = {}
+        self.last_error = None
+        self.sampled_calls = 0
+        self.max_peak_memory_bytes = 0
+        self._cprofile_stats = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, arg_bytes: int, error: Exception = None):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.total_arg_bytes += arg_bytes
+            self.max_arg_bytes = max(self.max_arg_bytes, arg_bytes)
+            if error is not None:
+                self.errors += 1
+                name = type(error).__name__
+                self.exceptions[name] = self.exceptions.get(name, 0) + 1
+                self.last_error = f"{name}: {error}"
+
+    def record_sample(self, profiler: cProfile.Profile = None, peak_memory: int = 0):
+        with self._lock:
+            self.sampled_calls += 1
+            self.max_peak_memory_bytes = max(self.max_peak_memory_bytes, peak_memory)
+            if profiler is not None:
+                if self._cprofile_stats is None:
+                    self._cprofile_stats = pstats.Stats(profiler, stream=io.StringIO())
+                else:
+                    self._cprofile_stats.add(profiler)
+
+    def _hottest(self, limit: int) -> list[dict]:
+        if self._cprofile_stats is None:
+            return []
+        rows = []
+        for (filename, line, function), (_, calls, _, cumtime, _) in (
+            self._cprofile_stats.stats.items()
+        ):
+            rows.append(
+                {
+                    "function": f"{os.path.basename(filename)}:{line}({function})",
+                    "calls": calls,
+                    "cumulative_seconds": cumtime,
+                }
+            )
+        rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+        return rows[:limit]
+
+    def snapshot(self, limit: int = 10) -> dict:
+        with self._lock:
+            snapshot = {
+                "calls": self.calls,
+                "errors": self.errors,
+                "total_seconds": self.total_seconds,
+                "mean_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+                "max_seconds": self.max_seconds,
+                "total_arg_bytes": self.total_arg_bytes,
+                "max_arg_bytes": self.max_arg_bytes,
+                "exceptions": dict(self.exceptions),
+                "last_error": self.last_error,
+            }
+            if _profile_modes:
+                snapshot["sampled_calls"] = self.sampled_calls
+            if "tracemalloc" in _profile_modes:
+                snapshot["max_peak_memory_bytes"] = self.max_peak_memory_bytes
+            if "cprofile" in _profile_modes:
+                snapshot["hottest_functions"] = self._hottest(limit)
+            return snapshot
+
+
+def _arg_bytes(args, kwargs) -> int:
+    return len(json.dumps([args, kwargs], default=repr))
+
+
+def _run_sampled(profile: ToolProfile, func, args, kwargs):
+    """Run one call under the opted-in profilers"""
+    profiler = None
+    if "cprofile" in _profile_modes and _cprofile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+    tracing = "tracemalloc" in _profile_modes
+    if tracing:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        if profiler is not None:
+            return profiler.runcall(func, *args, **kwargs)
+        return func(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            _cprofile_lock.release()
+        # Memory allocated by the call on top of what was already in use
+        peak = tracemalloc.get_traced_memory()[1] - baseline if tracing else 0
+        profile.record_sample(profiler, peak)
+
+
+def profiled_tool():
+    """Record the latency, argument size and exceptions of every call of a tool
+
+    Returns:
+        Callable: Decorator wrapping sync tools in a sync function and async ones in a coroutine,
+            so FastMCP keeps running each the way it did before
+    """
+
+    def decorator(func):
+        profile = ToolProfile()
+        _profiles[func.__name__] = profile
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    profile.record(
+                        time.perf_counter() - started_at, _arg_bytes(args, kwargs), e
+                    )
+                    raise
+                profile.record(time.perf_counter() - started_at, _arg_bytes(args, kwargs))
+                return result
+
+        else:
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                sampled = _profile_modes and profile.calls % _profile_every == 0
+                try:
+                    if sampled:
+                        result = _run_sampled(profile, func, args, kwargs)
+                    else:
+                        result = func(*args, **kwargs)
+                except Exception as e:
+                    profile.record(
+                        time.perf_counter() - started_at, _arg_bytes(args, kwargs), e
+                    )
+                    raise
+                profile.record(time.perf_counter() - started_at, _arg_bytes(args, kwargs))
+                return result
+
+        wrapper.profile = profile
+        return wrapper
+
+    return decorator
+
+
+def tool_metrics() -> dict:
+    """Profiles of all the profiled tools, by tool name"""
+    return {name: profile.snapshot() for name, profile in _profiles.items()}